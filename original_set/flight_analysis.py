@@ -1,6 +1,23 @@
 import os
 import sys
-import csv
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+try: # numba is optional - the kernels below run as plain NumPy without it
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        def wrap(func):
+            return func
+        return wrap
+
+try: # pyarrow is optional - its SIMD CSV parser beats the pandas C engine when installed
+    import pyarrow.csv as pacsv
+except ImportError:
+    pacsv = None
 
 import time
 start = time.time()
@@ -22,18 +39,14 @@ def time_list(time, channel):
     #
     # Identify times of trough occurances.
     #
-    # INPUT:    A channel as a list of floats where 1.00 indicates a trough and 0.00 no trough; time as a list of floats of TBF.
+    # INPUT:    A channel as an array of floats where 1.00 indicates a trough and 0.00 no trough; time as an array of floats
+    #           of TBF.
     #
-    # OUTPUT:   A time list of when each trough event occurs.
+    # OUTPUT:   A time array of when each trough event occurs.
     #
     #***************************************************************************************************************************
 
-    time_channel=[]
-    for i in range(0, len(channel)):
-        if float(channel[i]) == 1.00:
-            time_channel.append(float(time[i]))
-
-    return time_channel
+    return time[channel == 1.0]
 
 def speed_list(time, circ_flight_path):
     
@@ -56,32 +69,25 @@ def speed_list(time, circ_flight_path):
     #           Finally, this function automatically accounts for unused or empty channels and for instances in which only one
     #           flight event occurred.
     #
-    # OUTPUT:   A list of speed values as floats.
+    # OUTPUT:   An array of speed values as floats.
     #
     #***************************************************************************************************************************
 
-    speed_t=0
-    speed_channel=[]
-    speed_channel.append(0)
-    
+    speed_channel = np.zeros(1)
+
     if len(time) > 0:
         if len(time) > 2:
-            for i in range(1, len(time)):
-                if float(time[i]) != float(time[i-1]):
-                    speed_t = circ_flight_path/(float(time[i]) - float(time[i-1]))
-                    speed_channel.append(float(speed_t))
-                else:
-                    speed_channel.append(9999) 
-            
-            for x in range(0, len(speed_channel)): # Optional speed correction.
-                if float(speed_channel[x]) < 0.1: 
-                    speed_channel[x] = 0
+            dt = np.diff(time)
+            with np.errstate(divide='ignore'):
+                speeds = np.where(dt != 0, circ_flight_path/np.where(dt != 0, dt, 1), 9999)
+            speeds[speeds < 0.1] = 0 # Optional speed correction.
+            speed_channel = np.concatenate(([0.0], speeds))
 
         else:
             print ("Has only one peak - impossible to calculate motion stats")
     else:
         print ("Channel is empty")
-        
+
     return speed_channel
 
 
@@ -103,63 +109,70 @@ def distance(time, speed, circ_flight_path):
     #
     #           Finally, the average speed is calculated.
     #
-    # OUTPUT:   The fully filtered time lists and speed lists, the total distance the insect traveled during its flight trial,
+    # OUTPUT:   The fully filtered time and speed arrays, the total distance the insect traveled during its flight trial,
     #           and the average flight speed.
     #
     #***************************************************************************************************************************
 
     distance=0
     average_speed=0
-    time_new=[]
-    speed_new=[]
-    time_final=[]
-    speed_final=[]
+    time_final=np.zeros(0)
+    speed_final=np.zeros(0)
 
     if len(time) > 2:
-        
-        for i in range(1, len(speed)):
-            if float(speed[i]) > 0 and float(speed[i]) < 1.4: # Modify the threshold value accordingly
-                time_new.append(float(time[i]))
-                speed_new.append(float(speed[i]))
-                distance += circ_flight_path
+
+        mask = (speed[1:] > 0) & (speed[1:] < 1.4) # Modify the threshold value accordingly
+        time_new = time[1:][mask]
+        speed_new = speed[1:][mask]
+        distance = mask.sum() * circ_flight_path
 
         if len(time_new) > 2:
-            time_final.append(time_new[0])
-            speed_final.append(speed_new[0])
-            for j in range(0, len(time_new)-1):
-                if float(time_new[j+1]) - float(time_new[j]) <= 7: # The gap value can be changed accordingly
-                    time_final.append(time_new[j+1])
-                    speed_final.append(speed_new[j+1])
-            average_speed = sum(speed_final)/len(speed_final)
-            
+            keep = np.concatenate(([True], np.diff(time_new) <= 7)) # The gap value can be changed accordingly
+            time_final = time_new[keep]
+            speed_final = speed_new[keep]
+            average_speed = speed_final.mean()
+
         else:
             print('Cannot calculate distance and average speed')
     else:
         print('Cannot calculate distance and average speed')
-        
-    return (time_final, speed_final, distance, average_speed)  
 
-  
-def recording_duration(file_path):
-    
+    return (time_final, speed_final, distance, average_speed)
+
+
+@njit(cache=True, fastmath=True)
+def _bout_durations(time):
+
     #***************************************************************************************************************************
     #
-    # Calculates the duration of the recording.
+    # Identify the beginning and end time values of each bout and pair them into durations.
     #
-    # INPUT:    File path as a string.
+    # INPUT:    A filtered time array as floats.
     #
-    # PROCESS:  The function reads all the data, splits the data out as a list of strings (each string is a row), retrieves
-    #           the last line of the data, and gets the first element in the list of strings, which is the recording duration.
-    #
-    # OUTPUT:   The file's recording duration as a float.
+    # OUTPUT:   An array of bout durations in seconds.
     #
     #***************************************************************************************************************************
-  
-    with open(file_path, "r") as txtfile:
-        data = txtfile.readlines()         
-        tot_duration = float(data[-1].split(",")[0]) - float(data[0].split(",")[0])
 
-    return tot_duration
+    gaps = np.diff(time)
+    edges = np.where(gaps >= 20)[0]
+
+    first = time[0:1] if gaps[0] < 20 else np.zeros(0)
+    bout_time = np.concatenate((first, time[edges], time[edges+1], time[-1:]))
+    bout_time = np.unique(bout_time) # removes redundant values and sorts
+
+    last_time = 0.0
+    if len(bout_time)%2 != 0:
+        last_time = bout_time[-1]
+        bout_time = bout_time[:-1]
+
+    t_odd = bout_time[0::2]
+    t_even = bout_time[1::2]
+    bout_durations = t_even - t_odd
+
+    if last_time != 0:
+        bout_durations = np.concatenate((bout_durations, np.array([last_time - t_even[-1]])))
+
+    return bout_durations
 
 
 def flying_bouts(time, speed, recording_duration):
@@ -189,30 +202,16 @@ def flying_bouts(time, speed, recording_duration):
     #
     #***************************************************************************************************************************
     
-    bout_time = [] 
-    
-    t_odd = []
-    t_even = []
-    bout_durations = [] 
-    
-    last_time = 0
-    diff = 0
     flight_time = 0
     longest_bout = 0
     shortest_bout = 0
     
     
-    fly_time=0 
-    flight_60_300=[]
+    fly_time=0
     sum_60_300=0
-    flight_300_900=[]
     sum_300_900=0
-    flight_900_3600=[]
     sum_900_3600=0
-    flight_3600_14400=[]
     sum_3600_14400=0
-    flight_14400=[]
-    
     sum_14400=0
     events_300=0
     events_900=0
@@ -226,72 +225,29 @@ def flying_bouts(time, speed, recording_duration):
         # Part 1. Identifying and storing the beginning and end time values of each bout.
         #*********************************************************************************
 
-        if float(time[1]) - float(time[0]) < 20: 
-            bout_time.append(time[0])
-
-        for i in range(0, len(time)-1):
-            if float(time[i+1]) - float(time[i]) >= 20: 
-                bout_time.append(time[i])
-                bout_time.append(time[i+1])
-     
-        if bout_time[-1] != time[-1]:
-            bout_time.append(time[-1])
-
-        for t in range(1, len(bout_time)):
-            bout_time = sorted(list(set(bout_time))) # set() removes redundant values
+        bout_durations = _bout_durations(time)
 
         #*********************************************************************************
         # Part 2: Calculates the flight descriptive statistics.
         #*********************************************************************************
 
-        if len(bout_time)%2 != 0: 
-            last_time = float(bout_time[-1])
-            del bout_time[-1]
+        flight_time = bout_durations.sum()
+        fly_time = flight_time/recording_duration
+        longest_bout = bout_durations.max()
+
+        bins = np.array([60, 300, 900, 3600, 14400, np.inf])
+        idx = np.searchsorted(bins, bout_durations, side='left') - 1 # bin b holds (bins[b], bins[b+1]]
+        binned = idx >= 0 # bouts of 60s or less fall outside every range
 
-        t_odd = bout_time[0::2] 
-        t_even = bout_time[1::2] 
-        for j in range(0, len(t_odd)):
-            diff = float(t_even[j]) - float(t_odd[j])
-            bout_durations.append(diff) 
+        counts = np.bincount(idx[binned], minlength=5)
+        sums = np.bincount(idx[binned], weights=bout_durations[binned]/flight_time, minlength=5)
 
-        if float(last_time) != 0: 
-            diff = float(last_time) - float(t_even[-1])
-            bout_durations.append(diff)
+        sum_60_300, sum_300_900, sum_900_3600, sum_3600_14400, sum_14400 = sums
+        events_300, events_900, events_3600, events_14400, events_more_14400 = counts
+
+        if counts[0] > 0:
+            shortest_bout = bout_durations[idx == 0].min()
 
-        flight_time = sum(float(i) for i in bout_durations)
-        fly_time = flight_time/recording_duration
-        longest_bout = max(bout_durations)
-                
-        for k in range(0, len(bout_durations)): 
-            if float(bout_durations[k])>60 and float(bout_durations[k])<=300:
-                flight_60_300.append(float(bout_durations[k])/flight_time)
-            elif float(bout_durations[k])>300 and float(bout_durations[k])<=900:
-                flight_300_900.append(float(bout_durations[k])/flight_time)
-            elif float(bout_durations[k])>900 and float(bout_durations[k])<=3600:
-                flight_900_3600.append(float(bout_durations[k])/flight_time)
-            elif float(bout_durations[k])>3600 and float(bout_durations[k])<=14400:
-                flight_3600_14400.append(float(bout_durations[k])/flight_time)
-            elif float(bout_durations[k])>14400:
-                flight_14400.append(float(bout_durations[k])/flight_time)
-                
-        if len(flight_60_300) > 0:
-            sum_60_300=sum(float(a) for a in flight_60_300)
-            shortest_bout = float(min(flight_60_300))*flight_time
-        if len(flight_300_900) > 0:
-            sum_300_900=sum(float(b) for b in flight_300_900)
-        if len(flight_900_3600) > 0:
-            sum_900_3600=sum(float(c) for c in flight_900_3600)
-        if len(flight_3600_14400) > 0:
-            sum_3600_14400=sum(float(d) for d in flight_3600_14400)
-        if len(flight_14400) > 0:
-            sum_14400=sum(float(e) for e in flight_14400)
-            
-        events_300=len(flight_60_300)
-        events_900=len(flight_300_900)
-        events_3600=len(flight_900_3600)
-        events_14400=len(flight_3600_14400)
-        events_more_14400=len(flight_14400)
-        
     else:
         print('Channel has only one peak - cannot perform calculation')
 
@@ -313,32 +269,20 @@ def graph(time, speed):
     #           the last time value of the bout and a speed value of 0 m/s. Finally, each list
     #           ends with a time value of 0 and speed of 0.
     #
-    # OUTPUT:   Lists of time and speed as floats, but with time and speed values between bouts 
+    # OUTPUT:   Arrays of time and speed as floats, but with time and speed values between bouts
     #           that drop to speeds of zero. This makes plotting the speed vs. time flight
     #           trajectories of the insects clearer.
     #
     #**********************************************************************************************
 
-    time_new=[]
-    speed_new=[]
-    x=0
-    y=0
-    for i in range(0, len(time)-1):
-        if float(time[i+1]) - float(time[i]) > 20:
-            time_new.append(time[i])
-            speed_new.append(speed[i])
-            x=float(time[i]) + 1
-            time_new.append(x)
-            speed_new.append(0)
-            y=float(time[i+1]) -1
-            time_new.append(y)
-            speed_new.append(0)
-        else:
-            time_new.append(time[i])
-            speed_new.append(speed[i])
-    time_new.append(0)
-    speed_new.append(0)
-    
+    gap_idx = np.where(np.diff(time) > 20)[0]
+
+    ins_pos = np.repeat(gap_idx + 1, 2)
+    ins_t = np.stack((time[gap_idx] + 1, time[gap_idx+1] - 1), axis=1).ravel()
+
+    time_new = np.concatenate((np.insert(time[:-1], ins_pos, ins_t), [0]))
+    speed_new = np.concatenate((np.insert(speed[:-1], ins_pos, 0), [0]))
+
     return time_new, speed_new
 
 #************************************************************************************************************
@@ -358,31 +302,32 @@ distance_units = # identify SI distance units as a string here (e.g. 'm', 'cm',
 time_units = # identify SI time units as a string here (e.g. 's', 'min', 'hrs')
 speed_units = distance_units + '/' + time_units
 
-print(path, "\n")
+def analyze_file(filepath):
 
-big_list=[]
+    #**********************************************************************************************
+    #
+    # Run the full per-file analysis. Each file is independent of all others, which makes the
+    # directory loop embarrassingly parallel across worker processes.
+    #
+    # INPUT:    The file path as a string.
+    #
+    # OUTPUT:   A row of flight statistics for the summary file as a dictionary, and the per-file
+    #           log as a single string so the main process can write it in one call.
+    #
+    #**********************************************************************************************
 
-dir_list = sorted(os.listdir(path))
-for file in dir_list:
+    file = os.path.basename(filepath)
 
-    filepath = path + str(file)
-    tot_duration = recording_duration(filepath)
+    if pacsv is not None:
+        table = pacsv.read_csv(filepath, read_options=pacsv.ReadOptions(column_names=['t','ch']))
+        arr = np.column_stack([table.column('t').to_numpy(), table.column('ch').to_numpy()])
+    else:
+        arr = pd.read_csv(filepath, header=None, names=['t','ch'],
+                          dtype=np.float64, engine='c').values
+    time_column = arr[:,0]
+    trough_column = arr[:,1]
+    tot_duration = time_column[-1] - time_column[0]
 
-    input_file = open(filepath, mode="r")
-    data_list = list(input_file)
-    
-    time_column = []
-    trough_column = []
-    
-    for i in range(0, len(data_list)):
-        raw = data_list[i]
-        a,b = raw.split(",") 
-        time_column.append(a)
-        trough_column.append(b)
-     
-    input_file.close()
-
-    output_data = []
     row_data = {}
 
     # Filename String Manipulation: Channel Letters, Channel Numbers, and IDs
@@ -405,10 +350,11 @@ for file in dir_list:
     row_data["set_number"] = set_number
 
     # Flight Stats and Print Statements
-    
-    print("ID: ", ID)     
-    print('CHAMBER ' + channel_chamber + ' -------------------------------------------')
-    
+
+    buf = []
+    buf.append("ID:  " + ID)
+    buf.append('CHAMBER ' + channel_chamber + ' -------------------------------------------')
+
     time_channel = time_list(time_column, trough_column)
     speed_channel = speed_list(time_channel, flight_path)
     time_n, speed_n, dist, av_speed = distance(time_channel, speed_channel, flight_path)
@@ -417,19 +363,19 @@ for file in dir_list:
         fly_to_3600, fly_to_14400, fly_more_14400, event_300, event_900, event_3600, \
         event_14400, event_more_14400 = flying_bouts(time_n, speed_n, tot_duration)
     
-    print('Average speed (%s) -> ' %speed_units + '%.2f' % av_speed)
-    print('Total flight time (%s) -> ' %time_units + '%.2f' % fly_time)
-    print('Distance (%s) -> ' %distance_units + '%.2f' % dist)
-    print('Shortest flying bout (%s) -> ' %time_units + '%.2f' % short_bout)
-    print('Longest flying bout (%s) -> ' %time_units + '%.2f' %long_bout)
-    print('This individual spent ' + '%.3f' %flight + ' of its time flying with this composition: ')
-    print('  60s-300s = ' + '%.3f' %fly_to_300 + ' with ',event_300, 'events')
-    print('  300s-900s = ' + '%.3f' %fly_to_900 + ' with ',event_900, 'events')
-    print('  900s-3600s = ' + '%.3f' %fly_to_3600 + ' with ',event_3600, 'events')
-    print('  3600s-14400s = ' + '%.3f' %fly_to_14400 + ' with ',event_14400, 'events')
-    print('  +14400s = ' + '%.3f' %fly_more_14400 + ' with ',event_more_14400, 'events')
-    print('\n')
-    
+    buf.append('Average speed (%s) -> ' %speed_units + '%.2f' % av_speed)
+    buf.append('Total flight time (%s) -> ' %time_units + '%.2f' % fly_time)
+    buf.append('Distance (%s) -> ' %distance_units + '%.2f' % dist)
+    buf.append('Shortest flying bout (%s) -> ' %time_units + '%.2f' % short_bout)
+    buf.append('Longest flying bout (%s) -> ' %time_units + '%.2f' %long_bout)
+    buf.append('This individual spent ' + '%.3f' %flight + ' of its time flying with this composition: ')
+    buf.append('  60s-300s = ' + '%.3f' %fly_to_300 + ' with  %s events' %event_300)
+    buf.append('  300s-900s = ' + '%.3f' %fly_to_900 + ' with  %s events' %event_900)
+    buf.append('  900s-3600s = ' + '%.3f' %fly_to_3600 + ' with  %s events' %event_3600)
+    buf.append('  3600s-14400s = ' + '%.3f' %fly_to_14400 + ' with  %s events' %event_14400)
+    buf.append('  +14400s = ' + '%.3f' %fly_more_14400 + ' with  %s events' %event_more_14400)
+    buf.append('\n\n')
+
     time_graph, speed_graph = graph(time_n, speed_n)
 
     row_data['average_speed'] = round(av_speed, 2)
@@ -439,27 +385,45 @@ for file in dir_list:
     row_data['longest_flying_bout'] = round(long_bout, 2)        
     row_data['portion_flying'] = round(flight, 2)
     row_data['recording_duration'] = round(tot_duration, 2)
-    row_data['max_speed'] = round(max(speed_graph), 2)
-                
-    big_list.append(row_data)
-        
-# All Flight Stats Summary File
+    row_data['max_speed'] = round(speed_n.max(), 2) if len(speed_n) > 0 else 0.0
 
-outpath = main_path + "/data/"
-with open(outpath + "flight_stats_summary.csv", "w") as csv_file:
-    writer = csv.DictWriter(csv_file, fieldnames = big_list[1].keys())
-    writer.writeheader()
-    for row in big_list:
-        writer.writerow(row)
+    return row_data, "\n".join(buf)
 
-#**********************************************************************************************
-# Time it takes to execute the code.
-#**********************************************************************************************
+# Summary columns, stored as one array per statistic rather than one dict per file. The stats
+# are rounded to 2 decimals before serialization, so float32 loses nothing and halves the memory.
+
+summary_schema = {"ID": object, "filename": object, "trial_type": object, "chamber": object,
+                  "channel_letter": object, "channel_num": object, "set_number": object,
+                  "average_speed": np.float32, "total_flight_time": np.float32,
+                  "distance": np.float32, "shortest_flying_bout": np.float32,
+                  "longest_flying_bout": np.float32, "portion_flying": np.float32,
+                  "recording_duration": np.float32, "max_speed": np.float32}
+
+if __name__ == "__main__":
+
+    print(path, "\n")
+
+    dir_list = sorted(os.scandir(path), key=lambda e: e.name)
+    results = {col: np.empty(len(dir_list), dtype=d) for col, d in summary_schema.items()}
+    with ProcessPoolExecutor() as executor:
+        for i, (row_data, log) in enumerate(executor.map(analyze_file, [e.path for e in dir_list])):
+            sys.stdout.write(log)
+            for col in summary_schema:
+                results[col][i] = row_data[col]
+
+    # All Flight Stats Summary File
+
+    outpath = main_path + "/data/"
+    pd.DataFrame(results).to_csv(outpath + "flight_stats_summary.csv", index=False)
+
+    #**********************************************************************************************
+    # Time it takes to execute the code.
+    #**********************************************************************************************
 
-end = time.time()
+    end = time.time()
 
-print("---",(end - start), "seconds ---")
-print("---",(end - start) / 60, "mintues ---")
+    print("---",(end - start), "seconds ---")
+    print("---",(end - start) / 60, "mintues ---")
 
 #**********************************************************************************************
 # This file has been modified from Attisano et al. 2015.
@@ -1,12 +1,11 @@
 import os
-import csv
 import shutil
 import matplotlib
 import numpy as np
+import pandas as pd
 
 from matplotlib import style
 from matplotlib import pyplot as plt
-from scipy.interpolate import interp1d
 
 plt.style.use('ggplot')
 
@@ -19,81 +18,53 @@ def color_palette(data_path):
    # INPUT:    A path, data_path, as a string that leads to a file with ID, set number, chamber, 
    #           flight type, sex, population, mass, and host plant columns. 
    #
-   # PROCESS:  Generates dictionaries of each categorical group using csv.DictReader where keys
-   #           are unique bug identifies (e.g. ID, set number, and chamber) and values are colors
-   #           legible to matplotlib plot objects. In this sense, each dictionary becomes a 
-   #           'palette' where specific colors can be referenced to corresponding flight 
-   #           trajectories. 
+   # PROCESS:  Reads the data once with pandas, maps each categorical column to its colors in a
+   #           single vectorized pass, and zips the unique bug identifiers (e.g. ID, set number,
+   #           and chamber) with colors legible to matplotlib plot objects. In this sense, each
+   #           dictionary becomes a 'palette' where specific colors can be referenced to
+   #           corresponding flight trajectories.
    #
-   # OUTPUT:   'Palettes,' which are the dictionaries, are returned. 
+   # OUTPUT:   'Palettes,' which are the dictionaries, are returned.
    #
    # SOURCE:   https://matplotlib.org/3.2.1/tutorials/colors/colors.html
    #**********************************************************************************************
-        
-    flight_type_dict = {}
-    sex_dict = {}
-    pop_dict = {}
-    mass_dict = {}
-    host_dict = {}
-
-    with open(data_path, "r") as flight_data:
-        reader = csv.DictReader(flight_data)
-        for row in reader:
-            ID = row["ID"]
-            set_num = row["set_number"]
-            chamber = row["chamber"].split("-")[0] + row["chamber"].split("-")[-1]
-            flight_type = row["flight_type"]
-            sex = row["sex"]
-            pop = row["population"]
-
-            m = row["mass"]
-            if m == '':
-                m = "0.0"
-            mass = float(m)
-            
-            if (ID, chamber, set_num) not in flight_type_dict:
-                flight_type_dict[(ID, chamber, set_num)] = flight_type
-                
-            if (ID, set_num) not in sex_dict:
-                if sex == "F":
-                    sex_dict[(ID, set_num)] = "C0"
-                if sex == "M":
-                    sex_dict[(ID, set_num)] = "C1"
-                    
-            if (ID, set_num) not in host_dict:
-                if pop == "North Key Largo" or pop == "Key Largo" or pop == "Plantation Key":
-                    host_dict[(ID, set_num)] = "g"
-                else:
-                    host_dict[(ID, set_num)] = "b"
-                    
-            if (ID, set_num) not in pop_dict:
-                if pop == "North Key Largo":
-                    pop_dict[(ID, set_num)] = "b"
-                if pop == "Key Largo":
-                    pop_dict[(ID, set_num)] = "g"
-                if pop == "Plantation Key":
-                    pop_dict[(ID, set_num)] = "w"
-                if pop == "Homestead":
-                    pop_dict[(ID, set_num)] = "y"
-                if pop == "Gainesville":
-                    pop_dict[(ID, set_num)] = "k" #'tab:purple'
-                if pop == "Lake Wales":
-                    pop_dict[(ID, set_num)] = "r"
-                if pop == "Lake Placid":
-                    pop_dict[(ID, set_num)] = 'tab:orange'
-                if pop == "Leesburg":
-                    pop_dict[(ID, set_num)] = 'tab:pink'
-                    
-            if (ID, set_num) not in mass_dict:
-                if mass < 0.0527: # 0.05271686 mean of mass, calculated in R
-                    mass_dict[(ID, set_num)] = "k"
-                if mass >= 0.0527: 
-                    mass_dict[(ID, set_num)] = "r"
-   
+
+    pop_palette = {"North Key Largo": "b",
+                   "Key Largo": "g",
+                   "Plantation Key": "w",
+                   "Homestead": "y",
+                   "Gainesville": "k", #'tab:purple'
+                   "Lake Wales": "r",
+                   "Lake Placid": 'tab:orange',
+                   "Leesburg": 'tab:pink'}
+    key_largo_pops = ["North Key Largo", "Key Largo", "Plantation Key"]
+
+    df = pd.read_csv(data_path, dtype=str)
+    df["chamber_key"] = df["chamber"].str.split("-").str[0] + df["chamber"].str.split("-").str[-1]
+    df["mass_val"] = pd.to_numeric(df["mass"], errors="coerce").fillna(0.0)
+
+    by_trial = df.drop_duplicates(["ID", "chamber_key", "set_number"])
+    flight_type_dict = dict(zip(zip(by_trial["ID"], by_trial["chamber_key"], by_trial["set_number"]),
+                                by_trial["flight_type"]))
+
+    by_bug = df.drop_duplicates(["ID", "set_number"])
+    keys = list(zip(by_bug["ID"], by_bug["set_number"]))
+
+    sex_colors = by_bug["sex"].map({"F": "C0", "M": "C1"})
+    sex_dict = {k: c for k, c in zip(keys, sex_colors) if pd.notna(c)}
+
+    pop_colors = by_bug["population"].map(pop_palette)
+    pop_dict = {k: c for k, c in zip(keys, pop_colors) if pd.notna(c)}
+
+    host_dict = dict(zip(keys, np.where(by_bug["population"].isin(key_largo_pops), "g", "b")))
+
+    # 0.05271686 mean of mass, calculated in R
+    mass_dict = dict(zip(keys, np.where(by_bug["mass_val"] < 0.0527, "k", "r")))
+
     return flight_type_dict, sex_dict, pop_dict, mass_dict, host_dict
 
-def plot_trajectories(x, y, plt, filename, ID, set_n, chamber, flight_type_dictionary, sex_dictionary, pop_dictionary, 
-                                mass_dictionary, host_dictionary, outpath, plot_spline=False, plot_speed=False, 
+def plot_trajectories(x, y, ax, filename, ID, set_n, chamber, flight_type_dictionary, sex_dictionary, pop_dictionary,
+                                mass_dictionary, host_dictionary, outpath, plot_spline=False, plot_speed=False,
                                 plot_acc=False, individual=False):
 
    #**********************************************************************************************
@@ -101,7 +72,8 @@ def plot_trajectories(x, y, plt, filename, ID, set_n, chamber, flight_type_dicti
    # Plots either individual flight trajectories or a single graph of all flight trajectories.
    #
    # INPUT:    x, which represents time (s) as a list of floats; y, which represents speed (m/s) 
-   #           as a list of floats; plt as the plot object(s); and filename for the labels of each
+   #           as a list of floats; ax as the Axes all trajectories are drawn into (created once
+   #           by the caller and reused across files); and filename for the labels of each
    #           plot object as a string. Several keys are also included for palette color retrieval, 
    #           which include ID, set_n, and chamber as strings. Dictionaries that require 
    #           aforementioned keys for palette retrieval are also included. Addititionally, an 
@@ -114,7 +86,8 @@ def plot_trajectories(x, y, plt, filename, ID, set_n, chamber, flight_type_dicti
    #                 The last argument of np.linespace() determines the number of points to make 
    #                 per spline. It is currently set at 20, and it can be changed. Additionally,
    #                 to plot a second- or third-order spline the following can be added beneath
-   #                 the 'if plot_spline:' conditional, respectively:
+   #                 the 'if plot_spline:' conditional (after importing scipy.interpolate's
+   #                 interp1d), respectively:
    #                       f2 = interp1d(x, y, kind = 'quadratic')
    #                       f3 = interp1d(x, y, kind = 'cubic')
    #              2. Write 'True' for plot_spline or plot_acc to plot either speed or acceleration
@@ -140,9 +113,9 @@ def plot_trajectories(x, y, plt, filename, ID, set_n, chamber, flight_type_dicti
    # mass_color = mass_dictionary[(ID, set_n)]
    # host_color = host_dictionary[(ID, set_n)]  
 
-   initial_time = x[0]
-   for i in range(len(x)):
-      x[i] = x[i] - initial_time
+   x = np.asarray(x, dtype=np.float64)
+   y = np.asarray(y, dtype=np.float64)
+   x = x - x[0]
 
    x = x[0:len(x)-1]
    y = y[0:len(y)-1]
@@ -153,29 +126,23 @@ def plot_trajectories(x, y, plt, filename, ID, set_n, chamber, flight_type_dicti
       plot_acc=False
       individual=False
 
-   plt.title('Flight Trajectories')
-   plt.xlabel('Seconds from start') 
-   plt.legend(['linear'], loc='best')     
-
-   if plot_spline: 
-      xnew = np.linspace(min(x), max(x), 20)
-      x = np.array(x)
-      y = np.array(y)
-      f = interp1d(x, y) 
+   if plot_spline:
+      xnew = np.linspace(x.min(), x.max(), 20)
+      ynew = np.interp(xnew, x, y) # linear splines need no scipy interp1d object
       if individual:
-         plt.plot(x, y, 'c-',
-                  xnew, f(xnew), 'k-', # xnew, f2(xnew), 'k--', # xnew, f3(xnew), 'r--',
-                  markersize=1)
-         plt.legend(['data', 'linear'], loc='best') # add 'quadratic' and 'cubic' if plotting those too
-      
-      plt.plot(xnew, f(xnew), 'k-', markersize=1, linewidth=0.35)
+         ax.plot(x, y, 'c-',
+                 xnew, ynew, 'k-', # xnew, f2(xnew), 'k--', # xnew, f3(xnew), 'r--',
+                 markersize=1)
+         ax.legend(['data', 'linear'], loc='best') # add 'quadratic' and 'cubic' if plotting those too
+
+      ax.plot(xnew, ynew, 'k-', markersize=1, linewidth=0.35)
 
    if individual:
-      plt.title('Flight Data' + str(' ') + str(filename))
+      ax.set_title('Flight Data' + str(' ') + str(filename))
    if plot_speed:
-      plt.ylabel('Speed (m/s)')
+      ax.set_ylabel('Speed (m/s)')
    if plot_acc:
-      plt.ylabel('Acceleration (m/s/s)')
+      ax.set_ylabel('Acceleration (m/s/s)')
 
    if individual:
       if plot_speed:
@@ -183,8 +150,8 @@ def plot_trajectories(x, y, plt, filename, ID, set_n, chamber, flight_type_dicti
       if plot_acc:
          output_filename = 'acc_' + str(filename).replace(".txt", ".png")
       concatenated_path = os.path.join(outpath, output_filename)
-      plt.savefig(concatenated_path, dpi=300, bbox_inches='tight')
-      plt.clf()
+      ax.figure.savefig(concatenated_path, dpi=300, bbox_inches='tight')
+      ax.clear()
 
 ########################################################################################################################
 
@@ -194,7 +161,10 @@ if __name__=="__main__":
    summary_file_path = root_path + "1.trials-time-processed-Dec10.2020.csv"
    flight_type_dict, sex_dict, pop_dict, mass_dict, host_dict = color_palette(summary_file_path)
 
-   plt.figure()
+   fig, ax = plt.subplots() # one Figure reused across every file
+   ax.set_title('Flight Trajectories')
+   ax.set_xlabel('Seconds from start')
+
    path = root_path = "flight_analyses/"
    dir_list = sorted(os.listdir(path))
 
@@ -204,21 +174,18 @@ if __name__=="__main__":
       chamber = filename.split("_")[0].split("-")[-1]
 
       filepath = path + filename
-      input_file = open(filepath, mode="r", encoding='latin-1')
-      
-      times = []
-      speeds = []
-      for row in input_file:
-         split = row.split(',')
-         time = float(split[0])
-         speed = float(split[1]) 
-         times.append(time)
-         speeds.append(speed)
-
-      plot_trajectories(times, speeds, plt, filename, ID_num, set_num, chamber, 
-                                flight_type_dict, sex_dict, pop_dict, mass_dict, host_dict, root_path, 
+      data = np.loadtxt(filepath, delimiter=',', usecols=(0,1), dtype=np.float64,
+                        encoding='latin-1', ndmin=2)
+      if data.shape[0] < 2:
+         continue
+      times = data[:,0]
+      speeds = data[:,1]
+
+      plot_trajectories(times, speeds, ax, filename, ID_num, set_num, chamber,
+                                flight_type_dict, sex_dict, pop_dict, mass_dict, host_dict, root_path,
                                 plot_spline=True, plot_speed=True, plot_acc=False, individual=False)
 
+   ax.legend(['linear'], loc='best')
    outfile = root_path + "flight_trajectories-2.png"
-   plt.savefig(outpath + outfile, dpi=300, bbox_inches='tight')
-   plt.clf()
+   fig.savefig(outfile, dpi=300, bbox_inches='tight')
+   plt.close(fig)
@@ -1,14 +1,24 @@
 import os
-import csv
 import re
 import pandas as pd
 import numpy as np
 
 from KeyError_checks import trial_check
-from datetime import datetime, date
+
+try: # pyarrow is optional - its multi-threaded CSV parser beats csv.DictReader when installed
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+except ImportError:
+    pacsv = None
+
+try: # polars is optional - its lazy engine fuses the merge chain into one parallel plan
+    import polars as pl
+    HAS_POLARS = True
+except ImportError:
+    HAS_POLARS = False
 
 #************************************************************************************************************
-# Merging 5 datasets together using csv.DictReader and pandas.
+# Merging 5 datasets together using pandas (with optional pyarrow/polars acceleration).
 #************************************************************************************************************
 
 #***************************************************************************************
@@ -19,10 +29,9 @@ from datetime import datetime, date
 #   PROCESS: First, input the paths to each CSV file. Then, county_dict is written out
 #            as a dictionary where population is the key and the county the bugs were
 #            collected is the value.
-#            Next, the demographics csv file is opened and read in order to store its
-#            demographics information in two dictionaries. Finally, the trial csv file
-#            is opened and extracts the demographics data from the dictionaries and
-#            combines the information into a single csv file.
+#            Next, the demographics csv file is read into a dataframe. Finally, the
+#            trial csv file is read, filtered, and merged with the demographics data
+#            on ID and population to combine the information into a single csv file.
 #
 #***************************************************************************************
 
@@ -39,91 +48,99 @@ county_dict = {"Gainesville": "Alachua",
                "North Key Largo": "North Key Largo",
                "Plantation Key": "Plantation Key"}
 
-pop_dict = {} # this dictionary is used during egg data merging | 447 ID missed - no pop
-demo_dict = {}
-
-with open(demographics_data, "r") as demo_data:
-    reader = csv.DictReader(demo_data)
-    for row in reader:
-        ID = row["ID"]
-        sex = row["sex"]
-        pop = row["population"]
-        site = row["site"]
-        host = row["host_plant"]
-        lat = row["latitude"]
-        long = row["longitude"]
-
-        if ID not in pop_dict:
-            pop_dict[ID] = pop
-        if (ID, pop) not in demo_dict:
-            demo_dict[(ID,pop)] = [sex, site, host, lat, long]
-
-full_data = [] 
-with open(trial_data, "r") as trials:
-    reader = csv.DictReader(trials)
-    for r in reader:
-        if r["died?"] == 'Y' or r["NOTES"].startswith("BUG: short"):
-            continue
-
-        row_data = {}
-        ID_num = r["ID"]
-        population = r["population"]
-
-        # Extract Demographic Data
-        try:
-            demographics = demo_dict[(ID_num, population)]
-            sex, site, host_plant, lat, long = demographics[0], demographics[1], demographics[2], \
-                                               demographics[3], demographics[4]
-            
-            county = county_dict[population]
-            
-        except KeyError:
-            print("KeyError for ID, ", ID_num)
-            continue
-
-        row_data["ID"] = ID_num
-        row_data["set_number"] = r["set_number"]
-        row_data["chamber"] = r["chamber"]
-        row_data["test_date"] = r["test_date"]
-
-        # Time Calculations to Check Total Duration
-        row_data["time_start"] = r["time_start"]
-        row_data["time_end"] = r["time_end"]
-        
-        t_start_str = r['time_start']
-        t_end_str = r['time_end']
-        t_start_obj = datetime.strptime(t_start_str , '%H:%M:%S').time()
-        t_end_obj = datetime.strptime(t_end_str , '%H:%M:%S').time()
-
-        duration = (datetime.combine(date.min, t_end_obj) -
-                    datetime.combine(date.min, t_start_obj)).total_seconds()
-
-        row_data["duration_check"] = duration
-
-        # Rest of the Trial Data
-        row_data["sex"] = sex
-        row_data["population"] = population
-        row_data["county"] = county
-        row_data["site"] = site
-        row_data["host_plant"] = host_plant
-        row_data["flew"] = r["flew"]
-        row_data["flight_type"] = r["flight_type"]
-        row_data["NOTES"] = r["NOTES"]
-        row_data["mass"] = r["mass"]
-        row_data["EWM"] = r["eggs"]
-        row_data["trial_type"] = r["trial_type"]
-        row_data["latitude"] = lat
-        row_data["longitude"] = long
-
-        full_data.append(row_data)
+def read_csv_str(path):
 
-outpath = main_path + "2.trial-demographics.csv"
+    #***************************************************************************************
+    #   Bulk-read a CSV with every column kept as text, so each row round-trips exactly
+    #   like a csv.DictReader row. Uses pyarrow's parallel parser when it is installed
+    #   and falls back on the pandas C engine otherwise.
+    #***************************************************************************************
+
+    if pacsv is not None:
+        with open(path, "r") as f:
+            names = f.readline().strip().split(",")
+        convert = pacsv.ConvertOptions(column_types={name: pa.string() for name in names})
+        return pacsv.read_csv(path, convert_options=convert).to_pandas().fillna('')
+    return pd.read_csv(path, dtype=str, keep_default_na=False)
+
+cat_cols = ['ID', 'set_number', 'chamber', 'trial_type', 'sex', 'population', 'host_plant']
+
+def as_categories(df):
+
+    #***************************************************************************************
+    #   Dictionary-encode the repeated key columns so identical strings are stored once
+    #   and the merges hash small integer codes instead of UTF-8 text.
+    #***************************************************************************************
+
+    for c in cat_cols:
+        if c in df.columns:
+            df[c] = df[c].astype('category')
+    return df
+
+HAS_PARQUET = pacsv is not None # parquet support ships with pyarrow
+
+def write_intermediate(df, csv_path):
+
+    #***************************************************************************************
+    #   Stage outputs that only exist to be re-read by the next merge go to columnar
+    #   Parquet when pyarrow is installed - no CSV re-parsing or dtype re-inference
+    #   between stages. Without pyarrow the stage writes CSV as before.
+    #***************************************************************************************
+
+    if HAS_PARQUET:
+        df.to_parquet(csv_path.replace('.csv', '.parquet'), index=False)
+    else:
+        df.to_csv(csv_path, index=False)
+
+def read_intermediate(csv_path, csv_reader=pd.read_csv):
+    if HAS_PARQUET:
+        return pd.read_parquet(csv_path.replace('.csv', '.parquet'))
+    return csv_reader(csv_path)
+
+demo_df = as_categories(read_csv_str(demographics_data))
+
+# first occurrence wins, like the old row-by-row dict fills
+by_ID = demo_df.drop_duplicates("ID")
+pop_dict = dict(zip(by_ID["ID"], by_ID["population"])) # used during egg data merging | 447 ID missed - no pop
 
-with open(outpath, "w") as output_file:
-    writer = csv.DictWriter(output_file, fieldnames = row_data.keys())
-    writer.writeheader()
-    for r in full_data:
-        writer.writerow(r)
+demo_cols = demo_df.drop_duplicates(["ID", "population"])[["ID", "population", "sex",
+                                                           "site", "host_plant",
+                                                           "latitude", "longitude"]]
+
+trial_df = as_categories(read_csv_str(trial_data))
+
+# Boolean masks replace the per-row skip branches
+trial_df = trial_df[(trial_df["died?"] != 'Y') &
+                    (~trial_df["NOTES"].str.startswith("BUG: short"))]
+
+# Extract Demographic Data - one hashed merge instead of a dict lookup per row;
+# the indicator flags the trial rows with no demographics match
+trial_cols = ["ID", "set_number", "chamber", "test_date", "time_start", "time_end",
+              "flew", "flight_type", "NOTES", "mass", "eggs", "trial_type", "population"]
+merged = trial_df[trial_cols].merge(demo_cols, on=["ID", "population"],
+                                    how="left", indicator=True)
+
+missing = merged["_merge"] == "left_only"
+for ID_num in merged.loc[missing, "ID"]:
+    print("KeyError for ID, ", ID_num)
+merged = merged[~missing].drop(columns="_merge")
+
+merged["county"] = merged["population"].map(county_dict)
+
+# Time Calculations to Check Total Duration
+# cache=True parses each unique clock time once - trials share start/end times often
+t_start = pd.to_datetime(merged["time_start"], format='%H:%M:%S', cache=True)
+t_end = pd.to_datetime(merged["time_end"], format='%H:%M:%S', cache=True)
+merged["duration_check"] = (t_end - t_start).dt.total_seconds()
+
+merged = merged.rename(columns={"eggs": "EWM"})
+col_order = ["ID", "set_number", "chamber", "test_date", "time_start", "time_end",
+             "duration_check", "sex", "population", "county", "site", "host_plant",
+             "flew", "flight_type", "NOTES", "mass", "EWM", "trial_type",
+             "latitude", "longitude"]
+
+outpath = main_path + "2.trial-demographics.csv"
+merged[col_order].to_csv(outpath, index=False)
 
 #***************************************************************************************
 #
@@ -136,19 +153,20 @@ with open(outpath, "w") as output_file:
 #
 #***************************************************************************************
 
-path1 = main_path + "2.trial-demographics.csv"
-path1copy = main_path + "2.trial-demographics.csv"
 path2 = main_path + "2.flight_stats_summary.csv"
 
-df_trial_demo = pd.read_csv(path1, parse_dates = ['test_date'])
-df_analyses = pd.read_csv(path2)
+# MERGE 1's frame is still in memory - no need to re-read the CSV it just wrote
+df_trial_demo = merged[col_order].copy()
+df_trial_demo["test_date"] = pd.to_datetime(df_trial_demo["test_date"])
+for c in ("ID", "set_number"): # these parse as integers on a CSV round trip
+    df_trial_demo[c] = pd.to_numeric(df_trial_demo[c].astype(str))
+df_trial_demo = as_categories(df_trial_demo)
+
+df_analyses = as_categories(pd.read_csv(path2))
+
+bugs_tested_dict = trial_check(df_trial_demo, df_analyses)
 
-bugs_tested_dict = trial_check(path1, path2)         
-    
-stats_data = pd.merge(left=df_analyses, right=df_trial_demo,
-                       left_on=['ID', 'set_number', 'trial_type', 'chamber'],
-                       right_on=['ID', 'set_number', 'trial_type', 'chamber'],
-                       how='inner')
+join_keys = ['ID', 'set_number', 'trial_type', 'chamber']
 
 #***************************************************************************************
 #
@@ -174,101 +192,82 @@ eggs['pop'] = eggs['ID'].map(pop_dict)
 egg_outpath = main_path + "3.egg_data-final.csv"
 eggs.to_csv(egg_outpath, index=False, mode='w')
 
-merged_data = pd.merge(left=stats_data, right=egg_df_sums, left_on=['ID'],
-                       right_on=['ID'], how='left')
+if HAS_POLARS:
+    # both joins fuse into one lazy query plan executed across cores; the string
+    # cache lets the dictionary-encoded key columns compare across frames
+    with pl.StringCache():
+        merged_data = (pl.from_pandas(df_analyses).lazy()
+                         .join(pl.from_pandas(df_trial_demo).lazy(), on=join_keys, how='inner')
+                         .join(pl.from_pandas(egg_df_sums).lazy(), on='ID', how='left')
+                         .collect()
+                         .to_pandas())
+else:
+    stats_data = pd.merge(left=df_analyses, right=df_trial_demo,
+                           left_on=join_keys, right_on=join_keys, how='inner')
+    merged_data = pd.merge(left=stats_data, right=egg_df_sums, left_on=['ID'],
+                           right_on=['ID'], how='left')
 
 outpath = main_path + "4.main_data.csv"
-merged_data.to_csv(outpath, index=False, mode='w')
+write_intermediate(merged_data, outpath)
 
 #***************************************************************************************
 #
 #   MERGE 4. Egg-stats-demographics data with morphology data.
 #
-#   PROCESS: Store morphology measurements and sex recordings in dictionaries. Check to
-#            see that the sexes typed on the flight trials datasheet matches the more
-#            accurate sex recording from the morphology measurements. Merge and adjust
-#            the morphology and sex data with the eggs-stats-demographics data. 
+#   PROCESS: Read the morphology measurements and sex recordings into a dataframe.
+#            Check to see that the sexes typed on the flight trials datasheet match
+#            the more accurate sex recording from the morphology measurements, then
+#            join the morphology and sex data onto the eggs-stats-demographics data.
 #
 #***************************************************************************************
 
 morphology_data = main_path + "4.tested-morph.csv"
 main_data = main_path + "4.main_data.csv"
 
-check_sex_dict = {} # Check if ID and sex match
-update_sex_dict = {} 
-morph_measurements = {}
-
-with open(morphology_data, "r") as morph_data:
-    reader = csv.DictReader(morph_data)
-    for row in reader:
-        ID = row["ID"]
-        sex = row["sex"]
-        pop = row["population"]
-        
-        beak = row["beak"]
-        thorax = row["thorax"]
-        wing = row["wing"]
-        body = row["body"]
-        w_morph = row["w_morph"]
-        morph_notes = row["notes"]
-
-        if (ID, sex) not in check_sex_dict:
-            check_sex_dict[(ID, sex)] = pop
-        if ID not in update_sex_dict:
-            update_sex_dict[ID] = sex
-        if (ID, pop) not in morph_measurements:
-            morph_measurements[(ID,pop)] = [beak, thorax, wing, body, w_morph, morph_notes]
-            
-full_data = [] 
-with open(main_data, "r") as main_data:
-    reader = csv.DictReader(main_data)
-    for r in reader:
-        ID_num = r["ID"]
-        population = r["population"]
-        sex = r["sex"]
-        pop = re.sub('[^A-Z]', '', population)
-        if pop == "G":
-            pop = "GV"
-        if pop == "H":
-            pop = "HS"
-        if pop == "L":
-            pop = "LB"
-        
-        try:
-            pop = check_sex_dict[(ID_num, sex)]
-        except KeyError:
-            print("KeyError for ID, ", ID_num, "   wrong sex or no sex recorded in the trials datasheet")
-            print("     Old sex: ", sex)
-            sex = update_sex_dict[ID]
-            print("     New sex: ", sex)
-
-        r["sex"] = sex
-        
-        try:
-            r["beak"] = morph_measurements[(ID_num,pop)][0]
-            r["thorax"] = morph_measurements[(ID_num,pop)][1]
-            r["wing"] = morph_measurements[(ID_num,pop)][2]
-            r["body"] = morph_measurements[(ID_num,pop)][3]
-            r["w_morph"] = morph_measurements[(ID_num,pop)][4]
-            r["morph_notes"] = morph_measurements[(ID_num,pop)][-1]
-        except KeyError:
-            print("KeyError for ID and pop, ", ID_num, pop)
-            r["beak"] = ''
-            r["thorax"] = ''
-            r["wing"] = ''
-            r["body"] = ''
-            r["w_morph"] = ''
-            r["morph_notes"] = 'missing tube'           
-
-        full_data.append(r)
+morph_df = read_csv_str(morphology_data)
+main_df = read_intermediate(main_data, csv_reader=read_csv_str)
+
+# join keys stay text regardless of how the intermediate stored them
+for c in ("ID", "population", "sex"):
+    main_df[c] = main_df[c].astype(str)
+
+# normalized population abbreviation, one regex per unique value
+pop_abbrevs = {"G": "GV", "H": "HS", "L": "LB"}
+pop_norm = {p: pop_abbrevs.get(re.sub('[^A-Z]', '', p), re.sub('[^A-Z]', '', p))
+            for p in main_df["population"].unique()}
+main_df["pop"] = main_df["population"].map(pop_norm)
+
+# Check if ID and sex match - a join against the morphology sheet replaces the
+# per-row (ID, sex) dict lookup; a miss means the trials datasheet disagrees
+check_sex = morph_df.drop_duplicates(["ID", "sex"]).set_index(["ID", "sex"])["population"]
+main_df = main_df.join(check_sex.rename("morph_pop"), on=["ID", "sex"])
+
+mismatch = main_df["morph_pop"].isna()
+update_sex = morph_df.drop_duplicates("ID").set_index("ID")["sex"]
+new_sex = main_df.loc[mismatch, "ID"].map(update_sex)
+for ID_num, old_sex, sex in zip(main_df.loc[mismatch, "ID"],
+                                main_df.loc[mismatch, "sex"], new_sex):
+    print("KeyError for ID, ", ID_num, "   wrong sex or no sex recorded in the trials datasheet")
+    print("     Old sex: ", old_sex)
+    print("     New sex: ", sex)
+main_df.loc[mismatch, "sex"] = new_sex
+main_df["pop"] = main_df["morph_pop"].where(~mismatch, main_df["pop"])
+
+# morphology measurements attach through one indexed join on (ID, population)
+morph_cols = ["beak", "thorax", "wing", "body", "w_morph", "morph_notes"]
+measurements = (morph_df.drop_duplicates(["ID", "population"])
+                        .rename(columns={"notes": "morph_notes"})
+                        .set_index(["ID", "population"])[morph_cols])
+main_df = main_df.join(measurements, on=["ID", "pop"])
+
+no_tube = main_df["beak"].isna()
+for ID_num, p in zip(main_df.loc[no_tube, "ID"], main_df.loc[no_tube, "pop"]):
+    print("KeyError for ID and pop, ", ID_num, p)
+main_df.loc[no_tube, morph_cols] = ''
+main_df.loc[no_tube, "morph_notes"] = 'missing tube'
 
 outpath = main_path + "5.complete_flight_data.csv"
-
-with open(outpath, "w") as output_file:
-    writer = csv.DictWriter(output_file, fieldnames = r.keys())
-    writer.writeheader()
-    for r in full_data:
-        writer.writerow(r)
+write_intermediate(main_df.drop(columns=["pop", "morph_pop"]), outpath)
 
 #***************************************************************************************
 #
@@ -283,12 +282,16 @@ with open(outpath, "w") as output_file:
 tested_data = main_path + "5.complete_flight_data.csv"
 nontested_data = main_path + "5.not_tested-morph.csv"
 
-df_tested = pd.read_csv(tested_data)
+df_tested = read_intermediate(tested_data)
 df_nontested = pd.read_csv(nontested_data)
 df_nontested = df_nontested.drop(['month', 'year', 'months_since_start',
                                   'season', 'diapause', 'field_date_collected',
                                   'date_measured', 'date_recorded'], axis=1)
 
+# tag each frame before the concat instead of inferring tested-ness afterwards
+df_tested['tested'] = 'yes'
+df_nontested['tested'] = 'no'
+
 vertical_merge = pd.concat([df_tested, df_nontested.rename(
                                     columns={'pophost':'host_plant',
                                              'lat': 'latitude',
@@ -300,15 +303,10 @@ vertical_merge = pd.concat([df_tested, df_nontested.rename(
 
 col_names_order = list(df_tested.columns)
 vertical_merge = vertical_merge[col_names_order]
-vertical_merge['tested'] = np.where(vertical_merge['ID'] > 0, 'yes', 'no')
-
-vertical_merge['ID'] = np.where(vertical_merge['ID'] > 0,
-                                vertical_merge['ID'], 0).astype(int)
-vertical_merge[('channel_num')] = np.where(vertical_merge['channel_num'] > 0,
-                                vertical_merge[('channel_num')], 0).astype(int)
-vertical_merge[('set_number')] = np.where(vertical_merge['set_number'] > 0,
-                                vertical_merge[('set_number')], 0).astype(int)
 
+# a single fillna + cast per column replaces the three np.where round trips
+int_cols = ['ID', 'channel_num', 'set_number']
+vertical_merge[int_cols] = vertical_merge[int_cols].fillna(0).astype('int32')
 
 flight_outpath = main_path + "all_flight_data.csv"
-vertical_merge.to_csv(flight_outpath, index=False, mode='w')
+vertical_merge.to_csv(flight_outpath, index=False, mode='w', chunksize=100_000)
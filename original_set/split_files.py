@@ -1,8 +1,12 @@
 import csv
 import os
 import re
+import numpy as np
+import pandas as pd
 
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
+from functools import partial
 
 #*****************************************************************************************************
 #
@@ -13,6 +17,9 @@ from datetime import datetime, timedelta
 #
 #*****************************************************************************************************
 
+_EVENT_RE = re.compile(r'(\d+)') # extracts the bug ID from an event marker comment
+_FNAME_RE = re.compile(r'set(\d+).*-([A-Z])\.txt$') # set number and channel letter of a recording
+
 def define_dicts(datapath):
     
     #*****************************************************************************************************
@@ -68,6 +75,107 @@ def define_dicts(datapath):
                 
     return (first_flight_dict, current_flight_dict)
 
+def process_recording(filepath, file, outpath, first_flight_dict, current_flight_dict):
+
+    #*****************************************************************************************************
+    # Worker for map_IDs: maps the event-marker IDs of a single recording file. It runs in its
+    # own process, so everything it needs comes in as arguments.
+    #*****************************************************************************************************
+
+    header = ["TBF","1","2","3","4",
+              "event_happened","event_num","buffer","date","time","event_marker"]
+
+    #***********************************************************************************************************
+    #   Set the extraction of the set_number and channel_letter according to the filename on lines 133-135:
+    #
+    #   Use the split() function to split a string, in this case the filename, on any symbol.
+    #   For example, if the filename is instead as simple as '6-B.txt' where 6 is the
+    #   set number and B is the channel letter then the user can consider and write the following:
+    #
+    #   file.split("-")                     splits the filename into a list of ['6', 'B.txt']
+    #   file.split("-")[0]                  extracts only '6', the value at the 0th index of list ['6', 'B.txt']
+    #   file.split("-")[1]                  extracts 'B.txt', the value at the 1st index of list ['6', 'B.txt']
+    #   file.split("-")[1].split(".")       splits the string into a list of ['B', 'txt']
+    #   file.split("-")[1].split(".")[0]    extracts only 'B', the value at the 0th index of list ['B', 'txt']
+    #
+    #   This is not the only way to extract the set number or channel letter, but it is a example template. 
+    #
+    #***********************************************************************************************************
+        
+    m = _FNAME_RE.search(file) # one compiled pattern instead of repeated split() chains
+    set_num = m.group(1)
+    set_number = set_num.lstrip("0")
+    channel_letter = m.group(2)
+        
+    print(file + "--------------------------------")
+        
+    df = pd.read_csv(filepath, delimiter=',', names=header, encoding='latin',
+                     dtype=str, keep_default_na=False, engine='c')
+    df = df[~df['TBF'].str.startswith("Samples per sec.")]
+
+    # whole-column casts in C replace the per-value int(float(...)) conversions
+    event_num = pd.to_numeric(df['event_num'], errors='coerce').fillna(0).astype(np.int64).to_numpy()
+    event_happened = pd.to_numeric(df['event_happened'], errors='coerce').fillna(0).astype(np.int64).to_numpy()
+    event_num[(event_num == 1) & (event_happened == 3)] = 0 # false event markers
+
+    # every unique second parses once; repeated timestamps come from the cache
+    datetimes = pd.to_datetime(df['date'] + ' ' + df['time'],
+                               format='%m-%d-%y %H:%M:%S', cache=True)
+
+    # bug IDs come out of all markers in one vectorized pass; NaN marks a blank comment
+    event_bugs = pd.to_numeric(df['event_marker'].str.extract(_EVENT_RE, expand=False),
+                               errors='coerce').to_numpy()
+
+    current_bugs = {'channel1': first_flight_dict[(set_num,channel_letter,'1')],
+                    'channel2': first_flight_dict[(set_num,channel_letter,'2')],
+                    'channel3': first_flight_dict[(set_num,channel_letter,'3')],
+                    'channel4': first_flight_dict[(set_num,channel_letter,'4')]}
+
+    # The stateful walk only has to visit event rows: every segment between
+    # events shares one set of occupants, so the four bug columns are filled
+    # segment-wise and the Python loop is O(events) rather than O(rows).
+    n = len(df)
+    bug_cols = {c: np.empty(n, dtype=np.int64) for c in current_bugs}
+    keep = np.ones(n, dtype=bool)
+    seg_start = 0
+
+    for i in np.flatnonzero(event_num != 0):
+        if i == 0: # the first row only seeds current_bugs, it is never an event
+            continue
+        for c in current_bugs:
+            bug_cols[c][seg_start:i] = current_bugs[c]
+        seg_start = i
+
+        if np.isnan(event_bugs[i]): # blank event marker: drop the row, keep the occupants
+            keep[i] = False
+            continue
+
+        new_bug = int(event_bugs[i])
+        new_channel = current_flight_dict[(set_num, channel_letter, new_bug)]
+
+        event_num[i] -= 1 # removes false first event marker count
+        print('     Event Marker %s:'%(event_num[i]),
+              ' new bug %s replacing old bug %s at channel %s'%(new_bug,
+                                                                current_bugs['channel%s'%new_channel],
+                                                                new_channel))
+        current_bugs['channel%s'%new_channel] = new_bug
+
+    for c in current_bugs:
+        bug_cols[c][seg_start:] = current_bugs[c]
+
+    out = pd.DataFrame({'TBF': df['TBF'].to_numpy(),
+                        'channel1_voltage': df['1'].to_numpy(),
+                        'channel2_voltage': df['2'].to_numpy(),
+                        'channel3_voltage': df['3'].to_numpy(),
+                        'channel4_voltage': df['4'].to_numpy(),
+                        'event_num': event_num,
+                        'datetime': datetimes.to_numpy(),
+                        'channel1_bug': bug_cols['channel1'],
+                        'channel2_bug': bug_cols['channel2'],
+                        'channel3_bug': bug_cols['channel3'],
+                        'channel4_bug': bug_cols['channel4']})
+    out[keep].to_csv(outpath + file, index=False, header=False)
+
 def map_IDs(path, outpath):
     
     #*****************************************************************************************************
@@ -101,98 +209,47 @@ def map_IDs(path, outpath):
     #
     #*****************************************************************************************************
 
-    dir_list = sorted(os.listdir(path))
+    # scandir skips the names-list copy that os.listdir makes and caches stat info
+    dir_list = sorted((e for e in os.scandir(path) if not e.name.startswith(".")),
+                      key=lambda e: e.name)
 
-    header = ["TBF","1","2","3","4",
-              "event_happened","event_num","buffer","date","time","event_marker"]
+    # each recording is independent of the others, so files fan out across worker processes
+    worker = partial(process_recording, outpath=outpath,
+                     first_flight_dict=first_flight_dict,
+                     current_flight_dict=current_flight_dict)
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        list(executor.map(worker, [e.path for e in dir_list], [e.name for e in dir_list]))
 
-    for file in dir_list:
-        if file.startswith("."):
-            continue
-        filepath = path + str(file)
-        full_data = []
-        before_first_event = True
-
-        #***********************************************************************************************************
-        #   Set the extraction of the set_number and channel_letter according to the filename on lines 133-135:
-        #
-        #   Use the split() function to split a string, in this case the filename, on any symbol.
-        #   For example, if the filename is instead as simple as '6-B.txt' where 6 is the
-        #   set number and B is the channel letter then the user can consider and write the following:
-        #
-        #   file.split("-")                     splits the filename into a list of ['6', 'B.txt']
-        #   file.split("-")[0]                  extracts only '6', the value at the 0th index of list ['6', 'B.txt']
-        #   file.split("-")[1]                  extracts 'B.txt', the value at the 1st index of list ['6', 'B.txt']
-        #   file.split("-")[1].split(".")       splits the string into a list of ['B', 'txt']
-        #   file.split("-")[1].split(".")[0]    extracts only 'B', the value at the 0th index of list ['B', 'txt']
-        #
-        #   This is not the only way to extract the set number or channel letter, but it is a example template. 
-        #
-        #***********************************************************************************************************
-        
-        set_num = file.split('-')[0][6:] 
-        set_number = set_num.lstrip("0")
-        channel_letter = file.split('.')[0][-1]
-        
-        print(file + "--------------------------------")
-        
-        with open(filepath, 'r', encoding='latin') as input_file:
-            reader = csv.DictReader(input_file, delimiter = ',', fieldnames=header)
-            for row in reader:
-                if row['TBF'].startswith("Samples per sec."):
-                    continue
-                if (int(float(row['event_num'])) == 1) and (int(float(row['event_happened'])) == 3): # false event marker
-                    row['event_num'] = '0'
-                    row['event_happened'] = '0'
-                
-                new_row = {}
-                new_row['TBF'] = row['TBF']
-                new_row['channel1_voltage'] = row['1']
-                new_row['channel2_voltage'] = row['2']
-                new_row['channel3_voltage'] = row['3']
-                new_row['channel4_voltage'] = row['4']
-                new_row['event_num'] = row['event_num']
-                
-                datetime_str = row['date'] + ' ' + row['time']
-                datetime_object = datetime.strptime(datetime_str,'%m-%d-%y %H:%M:%S')  
-                new_row['datetime'] = datetime_object
-                
-                
+def split_one_file(filepath, f, outpath):
 
-                if before_first_event:
+    #*****************************************************************************************************
+    # Worker for split_files: splits a single mapped recording into per-insect files. It runs
+    # in its own process.
+    #*****************************************************************************************************
 
-                    current_bugs = {'channel1': first_flight_dict[(set_num,channel_letter,'1')],
-                                    'channel2': first_flight_dict[(set_num,channel_letter,'2')],
-                                    'channel3': first_flight_dict[(set_num,channel_letter,'3')],
-                                    'channel4': first_flight_dict[(set_num,channel_letter,'4')]}
+    col_names = ["TBF","1","2","3","4", "event_num", "datetime",
+                 "chn1_ID","chn2_ID","chn3_ID","chn4_ID"]
 
-                    before_first_event = False
+    # Set the extraction of the set_num and channel_letter according to the filename pattern:
+    m = _FNAME_RE.search(f)
+    set_num = m.group(1)
+    channel_letter = m.group(2)
+        
+    print("File splitting: " + f + "--------------------------------")
 
-                elif (not before_first_event) and (int(float(row['event_num'])) != 0):
-                    if row["event_marker"] == '' or row["event_marker"] == None:
-                        continue
-                    new_bug = int(re.search(r'\d+', row['event_marker']).group())
-                    new_channel = current_flight_dict[(set_num, channel_letter, new_bug)]
+    # one parse per file instead of one per channel
+    df = pd.read_csv(filepath, names=col_names, dtype=str,
+                     keep_default_na=False, engine='c')
 
-                    event_number = int(row['event_num']) - 1  # removes false first event marker count
-                    new_row['event_num'] = event_number
-                    print('     Event Marker %s:'%(event_number),
-                          ' new bug %s replacing old bug %s at channel %s'%(new_bug,
-                                                                            current_bugs['channel%s'%new_channel],
-                                                                            new_channel))
-                    current_bugs['channel%s'%new_channel] = new_bug
-                
-                new_row['channel1_bug'] = current_bugs['channel1']
-                new_row['channel2_bug'] = current_bugs['channel2']
-                new_row['channel3_bug'] = current_bugs['channel3']
-                new_row['channel4_bug'] = current_bugs['channel4']
+    for channel in range(1,5):
+        sub = df[['TBF', str(channel), 'datetime']].rename(columns={str(channel): 'voltage'})
+        sub['ID'] = df['chn' + str(channel) + '_ID']
 
-                full_data.append(new_row)
-                
-        with open(outpath + file,"w") as output_file:
-            writer = csv.DictWriter(output_file, delimiter=',', fieldnames=new_row.keys())
-            for r in full_data:
-                writer.writerow(r)
+        for key_ID, g in sub.groupby('ID', sort=False):
+            print("     Making file for ID, " + str(key_ID))
+            g.drop(columns='ID').to_csv(outpath + f.split(".")[0] + str(channel) + \
+                                        '_' + str(key_ID) + ".txt",
+                                        index=False, header=False)
 
 def split_files(path, outpath):
     
@@ -217,64 +274,31 @@ def split_files(path, outpath):
     #
     #*****************************************************************************************************         
 
-    dir_files = sorted(os.listdir(path))
-
-    col_names = ["TBF","1","2","3","4", "event_num", "datetime",
-                 "chn1_ID","chn2_ID","chn3_ID","chn4_ID"]
-
-    for f in dir_files:
-        if f.startswith("."):
-            continue
-        
-        filepath = path + str(f)
-        
-        # Set the extraction of the set_num and channel_letter according to filename in lines 232-233:
-        set_num = f.split('-')[0][6:]
-        channel_letter = f.split('.')[0][-1]
-        
-        print("File splitting: " + f + "--------------------------------")
-
-        for channel in range(1,5):
-            ID_data = {}
-            with open(filepath, "r") as input_file:
-                reader = csv.DictReader(input_file,fieldnames=col_names)
-                for row in reader:
-                    ID = row['chn' + str(channel) + '_ID']
-
-                    new_row = {}
-                    new_row['TBF'] = row['TBF']
-                    new_row['voltage'] = row[str(channel)]
-                    new_row['datetime'] = row['datetime']
-
-                    if ID not in ID_data:
-                        ID_data[ID] = []
-                    ID_data[ID].append(new_row)
-        
-            for key_ID, data in ID_data.items():
-                print("     Making file for ID, " + str(key_ID))
-                with open(outpath + f.split(".")[0] + str(channel) + \
-                          '_' + str(key_ID) + ".txt","w") as output_file:
-                    writer = csv.DictWriter(output_file, fieldnames=new_row.keys())
-                    for r in data:
-                        writer.writerow(r)
+    dir_files = sorted((e for e in os.scandir(path) if not e.name.startswith(".")),
+                       key=lambda e: e.name)
 
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        list(executor.map(partial(split_one_file, outpath=outpath),
+                          [e.path for e in dir_files], [e.name for e in dir_files]))
 
 #*****************************************************************************************************
 #   Write file main path down below. An example path is r"/Users/username/Desktop/Flight_scripts/".
 #*****************************************************************************************************
 
-main_path = # input the path to the Flight_scripts directory here 
+if __name__ == "__main__": # guard so spawned pool workers re-importing the module don't rerun this
+
+    main_path = # input the path to the Flight_scripts directory here
 
-# Defining dictionaries:
-datafile = main_path + "data/datasheet.csv"
-first_flight_dict, current_flight_dict = define_dicts(datafile)
+    # Defining dictionaries:
+    datafile = main_path + "data/datasheet.csv"
+    first_flight_dict, current_flight_dict = define_dicts(datafile)
 
-# Mapping event marker IDs:
-txt_inpath = main_path + "recordings/"
-txt_outpath = main_path + "files2split/"
-map_IDs(txt_inpath, txt_outpath) 
+    # Mapping event marker IDs:
+    txt_inpath = main_path + "recordings/"
+    txt_outpath = main_path + "files2split/"
+    map_IDs(txt_inpath, txt_outpath)
 
-# Splitting files by ID:
-split_inpath = main_path + "files2split/"
-split_outpath = main_path + "split_files/"
-split_files(split_inpath, split_outpath)
+    # Splitting files by ID:
+    split_inpath = main_path + "files2split/"
+    split_outpath = main_path + "split_files/"
+    split_files(split_inpath, split_outpath)
@@ -1,31 +1,28 @@
-import csv
+import pandas as pd
 
-def trial_check(path1, path2):
+def _key_frame(data):
+    # accepts an in-memory DataFrame or a CSV path, so callers need not re-read files
+    if isinstance(data, pd.DataFrame):
+        return data
+    return pd.read_csv(data, usecols=["ID", "set_number"], dtype=str)
+
+def trial_check(data1, data2):
 
     #***************************************************************************************
     #   Check to see that the ID and set number from the handwritten data matches the ID
-    #   and set number of the recorded data of the flight trials.
+    #   and set number of the recorded data of the flight trials. Membership is tested
+    #   against a set of (ID, set_number) keys rather than raising KeyError per miss.
+    #   Both arguments can be DataFrames already in memory or paths to CSV files.
     #***************************************************************************************
 
-    match_dict = {}
-    with open(path2, "r") as data2:
-        reader = csv.DictReader(data2)
-        for row in reader:
-            ID = row["ID"]
-            set_num = row["set_number"].lstrip("0")
-
-            if (ID, set_num) not in match_dict:
-                match_dict[(ID, set_num)] = ' '
-
-    with open(path1, "r") as data1:
-        reader = csv.DictReader(data1)
-        for r in reader:
-            ID_num = r["ID"]
-            set_num = r["set_number"].lstrip("0")
+    df2 = _key_frame(data2)
+    keys = set(zip(df2["ID"].astype(str),
+                   df2["set_number"].astype(str).str.lstrip("0")))
 
-            try:
-                success = match_dict[(ID_num, set_num)]
-            except KeyError:
-                print("KeyError for ID, ", ID_num, " and set num, ", set_num)
+    df1 = _key_frame(data1)
+    for ID_num, set_num in zip(df1["ID"].astype(str),
+                               df1["set_number"].astype(str).str.lstrip("0")):
+        if (ID_num, set_num) not in keys:
+            print("KeyError for ID, ", ID_num, " and set num, ", set_num)
 
-    return match_dict
+    return dict.fromkeys(keys, ' ')
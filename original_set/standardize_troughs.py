@@ -3,6 +3,57 @@ import math
 import numpy as np
 import matplotlib.pyplot as plt
 
+try: # numba is optional - the kernels below run as plain Python loops without it
+    from numba import njit, prange
+except ImportError:
+    def njit(*args, **kwargs):
+        def wrap(func):
+            return func
+        return wrap
+    prange = range
+
+@njit('int8[:](int8[:], int64)', cache=True)
+def _correct_double_troughs(int_list, sample_rate):
+
+    #************************************************************************************************************
+    #
+    # Walks the 0/1 deviance sequence, marks each clean trough with a single 1, and erases false
+    # second troughs by zeroing the following sample_rate-long window (see the Double Trough Case
+    # in trough_standardization). Branchy integer control flow, so numba compiles it when present.
+    #
+    #************************************************************************************************************
+
+    n = int_list.shape[0]
+    troughs = np.zeros(n, dtype=np.int8)
+    for j in range(n - 1):
+        if int_list[j] > int_list[j-1] and int_list[j] >= int_list[j+1]:
+            if (int_list[j-3] >= int_list[j] or int_list[j-5] >= int_list[j]
+                    or int_list[j-7] >= int_list[j]): # double troughs correction
+                for i in range(j, min(j + sample_rate, n)):
+                    int_list[i] = 0
+            else:
+                troughs[j] = 1
+    return troughs
+
+@njit('int32[:,:](float32[:], float32, float64[:], int64)', cache=True, parallel=True)
+def sweep_troughs(rounded, channel_mean, devs, sample_rate):
+
+    #************************************************************************************************************
+    #
+    # Counts troughs for every (min deviation, max deviation) pair of the diagnostics grid. The pairs
+    # are independent of each other, so the outer loop runs across cores under numba's prange.
+    #
+    #************************************************************************************************************
+
+    out = np.empty((devs.size, devs.size), dtype=np.int32)
+    for i in prange(devs.size):
+        for j in range(devs.size):
+            min_val = round(channel_mean - devs[i], 2) # *
+            max_val = round(channel_mean + devs[j], 2) # *
+            int_list = ((rounded - min_val) / (max_val - min_val) < -2).astype(np.int8) # *
+            out[i, j] = _correct_double_troughs(int_list, sample_rate).sum()
+    return out
+
 def trough_standardization(column, dev_min, dev_max, sample_rate):
     
     #************************************************************************************************************
@@ -37,44 +88,31 @@ def trough_standardization(column, dev_min, dev_max, sample_rate):
     #
     #************************************************************************************************************
 
-    volt_column = [] 
-    int_list =[] # sequences of 0s and 1s. 
-    troughs=[]
-    
-    for i in range(0, len(column)): 
-        volt_column.append(round(column[i], 2))
-    
-    channel_mean = (sum(volt_column)/len(volt_column))
-    min_val=round(channel_mean - dev_min, 2) # * 
+    volt_column, channel_mean = _prep(column)
+    return _standardize(volt_column, channel_mean, dev_min, dev_max, sample_rate)
+
+def _prep(column):
+
+    # Rounding and the mean depend only on the voltages, so diagnostics sweeps
+    # compute them once per file and reuse them for every deviation combination.
+    rounded = np.round(np.asarray(column, dtype=np.float32), 2)
+    return rounded, rounded.mean()
+
+def _standardize(volt_column, channel_mean, dev_min, dev_max, sample_rate):
+
+    min_val=round(channel_mean - dev_min, 2) # *
     max_val=round(channel_mean + dev_max, 2) # *
- 
-    for v in range(0, len(volt_column)):  
-        x=(volt_column[v]-min_val)/(max_val-min_val) 
-        if x < -2:  # *
-            int_list.append(1)  
-        else:
-            int_list.append(0)
-
-    for j in range(0, len(int_list)-1): 
-        if int_list[j] > int_list[j-1] and int_list[j] >= int_list[j+1]: 
-            if int_list[j-3] >= int_list[j] or int_list[j-5] >= int_list[j] or int_list[j-7] >= int_list[j]: # double troughs correction
-                troughs.append(0)
-                for i in range(j, j + sample_rate): 
-                    try:
-                        int_list[i] = 0
-                    except IndexError:
-                        continue 
-            else:
-                troughs.append(1)
-        else:
-            troughs.append(0)
 
-    troughs.append(0)
+    # sequences of 0s and 1s; one vectorized threshold replaces the per-sample loop
+    x = (volt_column - min_val) / (max_val - min_val)
+    int_list = (x < -2).astype(np.int8)  # *
 
-    print("   Num of 1's:", sum(int_list), "   Num of troughs:", sum(troughs),
+    troughs = _correct_double_troughs(int_list, sample_rate)
+
+    print("   Num of 1's:", int_list.sum(), "   Num of troughs:", troughs.sum(),
           "   Min Dev: ", dev_min, "   Max Dev: ", dev_max)
-    
-    return troughs 
+
+    return troughs
 
 def map_diagnostics(deviations, f, heat_map, axs, sampling_rate):
 
@@ -95,16 +133,15 @@ def map_diagnostics(deviations, f, heat_map, axs, sampling_rate):
     #
     #************************************************************************************************************
     
-    all_troughs = []
-    for volt_dev_min in deviations:
-        num_troughs = []
-        for volt_dev_max in deviations:
-            troughs_col = trough_standardization(voltage_column, volt_dev_min, volt_dev_max, sampling_rate)
-            num_troughs.append(sum(troughs_col))
-        all_troughs.append(num_troughs)
-
-    a = np.array(all_troughs)
-    axs = axs.flatten()
+    rounded, channel_mean = _prep(voltage_column) # shared by all deviation combos
+
+    # one parallel kernel call replaces the Python double loop over the grid
+    a = sweep_troughs(rounded, channel_mean, np.asarray(deviations), sampling_rate)
+    all_troughs = a.tolist()
+
+    # the returned trough column still comes from the last deviation pair, as before
+    troughs_col = _standardize(rounded, channel_mean, deviations[-1], deviations[-1], sampling_rate)
+
     im = axs[f].imshow(a, cmap='viridis', interpolation='nearest')
 
     axs[f].title.set_text(file + '\nMax-Min Troughs=%i' %(max(all_troughs)[0]-min(all_troughs)[-1]))
@@ -118,34 +155,30 @@ def map_diagnostics(deviations, f, heat_map, axs, sampling_rate):
     cbar = heat_map.colorbar(im, ax=axs[f], fraction=0.046, pad=0.03)
     cbar.ax.set_ylabel("Number of Troughs", rotation=-90, va="bottom")
     
-    rows, cols = a.shape
-    for i in range(rows):
-        for j in range(cols):
-            text = axs[f].text(j, i, a[i, j], ha="center", va="center", color="w", fontsize=5.5)
+    text = axs[f].text # bind once; one attribute lookup instead of one per cell
+    for (i, j), label in np.ndenumerate(a):
+        text(j, i, label, ha="center", va="center", color="w", fontsize=5.5)
     
     return troughs_col
 
-def write_to_file(outpath, file_name, lines, time_col, trough_col):
-    
+def write_to_file(outpath, file_name, time_col, trough_col):
+
     #************************************************************************************************************
     #
     # Write txt file for the standardized troughs.
     #
-    # INPUT:    outpath as a string, file name as a string, lines as an integer, time column as floats, and
-    #           trough column as floats. 
+    # INPUT:    outpath as a string, file name as a string, time column as floats, and trough column as floats.
     #
-    # PROCESS:  Output file is opened with its designated outpath. Then, line by line, the time and trough rows
-    #           are written.
+    # PROCESS:  The time and trough columns are stacked and written in a single np.savetxt call, which
+    #           formats the rows in C instead of one Python write per line.
     #
     # OUTPUT:   A txt file with two columns: a TBF column and a trough column of 0's and 1's.
     #
     #************************************************************************************************************
-    
-        OutputFile = open(outpath + "standardized_" + str(file_name), mode="w")
-        for i in range(0, len(lines)):
-            OutputFile.write('%.2f' % time_col[i] + ", " +
-                             '%.2f' % trough_col[i] + "\n")
-        OutputFile.close()
+
+        np.savetxt(outpath + "standardized_" + str(file_name),
+                   np.column_stack([np.asarray(time_col), np.asarray(trough_col)]),
+                   fmt='%.2f', delimiter=', ')
 
 #************************************************************************************************************
 #   To call the recording data file, write the complete file directory path below. An example path is
@@ -162,7 +195,8 @@ dir_list = sorted(os.listdir(path))
 
 hrows = math.ceil(len(dir_list) / 5)  
 hmap, haxes = plt.subplots(hrows,5, figsize=(20, 4*hrows), facecolor='w', edgecolor='k')
-hmap.tight_layout(pad=5.1) 
+hmap.tight_layout(pad=5.1)
+haxes = haxes.flatten() # flatten once here, not once per map_diagnostics call
 
 print("Files in '", path, "' :")
 
@@ -171,19 +205,10 @@ for file in dir_list:
     
     print("\n", file)
     filepath = path + str(file)
-    InputFile = open(filepath, mode="r", encoding='latin-1')
-
-    Lines = InputFile.readlines()
-    time_column = []
-    voltage_column = []
-
-    for i in range(0, len(Lines)):
-        raw = Lines[i]
-        a,b,c = raw.split(",") 
-        time_column.append(float(a)) 
-        voltage_column.append(float(b)) 
 
-    InputFile.close()
+    # C parser reads the file in one call instead of splitting and casting per line
+    data = np.loadtxt(filepath, delimiter=',', usecols=(0, 1), dtype=np.float32, encoding='latin-1')
+    time_column, voltage_column = data[:, 0], data[:, 1]
 
     devs = [0.01, 0.02, 0.03, 0.04, 0.05, 0.06, 0.07, 0.08, 0.09, 0.10]
     trough_column = map_diagnostics(devs, file_num, hmap, haxes, sampling_freq) # Comment out this line after running diagnostics
@@ -197,7 +222,7 @@ for file in dir_list:
     
     #trough_column = trough_standardization(voltage_column, 0.1, 0.1, sampling_freq) # * Uncomment this line after running diagnostics
     out_path = main_path + "standardized_files/"
-    write_to_file(out_path, file, Lines, time_column, trough_column) 
+    write_to_file(out_path, file, time_column, trough_column)
 
 hmap.savefig("trough_diagnostic.png") # Comment out this line after running diagnostics
 
@@ -1,26 +1,32 @@
 import os
 import csv
-import sys
 import math
 import time
+import itertools
+
+from functools import partial
+from collections import defaultdict
 
 import numpy as np
 import multiprocessing as mp
 import matplotlib.pyplot as plt
 
-from standardize_troughs import trough_standardization
+from standardize_troughs import _prep, _standardize
 from flight_analysis import time_list, speed_list, distance
 from flight_analysis import blockPrint, enablePrint
 
-def standardize(filepath, min_dev, max_dev, trough_standardization):
+COMBO_KEYS = tuple(f"combo_{i+1}" for i in range(25)) # one key per (min dev, max dev) pair
+
+def standardize(volt_column, channel_mean, min_dev, max_dev, _standardize):
 
     #************************************************************************************************************
     #
     # Standardizes the voltage data for each channel by identifying large deviances in voltages as troughs.
     #
-    # INPUT:    List of voltage values as floats.
+    # INPUT:    The prepped (rounded) voltage array and its mean from _prep, which are computed once per
+    #           file and shared by every deviation combination of the sweep.
     #
-    # PROCESS:  Voltage values are rounded to two decimal places and appended to the volt_column. A confidence
+    # PROCESS:  A confidence
     #           interval is defined around the mean voltage value using a low (min_dev) and high (max_dev)
     #           threshold. These values can be defined by the user according to the characteristics of the
     #           voltage recording data. Voltages at or higher than the min value of the confidence interval
@@ -33,34 +39,19 @@ def standardize(filepath, min_dev, max_dev, trough_standardization):
     #           Threshold values can be modified accordingly. They are labeled with a '*'. The default values
     #           are set to deliver a fine tune signal standardization.
     #
-    # OUTPUT:   A list of time values as floats and a list of 1s and 0s where 1 designates the presence of a 
-    #           trough and 0 designates no trough.
+    # OUTPUT:   A list of 1s and 0s where 1 designates the presence of a trough and 0 designates no trough.
     #
     #************************************************************************************************************
 
-    InputFile = open(filepath, mode="r", encoding='latin-1')
-    Lines = InputFile.readlines()
-    
-    time_column = []
-    voltage_column = []
-
-    for i in range(0, len(Lines)):
-        raw = Lines[i]
-        a,b,c = raw.split(",") 
-        time_column.append(float(a)) 
-        voltage_column.append(float(b)) 
-
-    InputFile.close()
-    
-    trough_column = trough_standardization(voltage_column, min_dev, max_dev) 
+    trough_column = _standardize(volt_column, channel_mean, min_dev, max_dev)
 
-    return (time_column, trough_column)
+    return trough_column
 
 def analyze(time_column, trough_column, time_list, speed_list, distance):
 
     time_channel = time_list(time_column, trough_column)
     speed_channel = speed_list(time_channel)
-    time_n, speed_n, dist, av_speed = distance(time_channel, speed_channel)
+    time_n, speed_n, dist, av_speed, max_times, max_speeds = distance(time_channel, speed_channel)
     
     return (round(av_speed,2), round(dist,2))
 
@@ -111,7 +102,6 @@ def heat_map(deviations, f, heat_map, axs, matrix, filename, bar_title):
     #************************************************************************************************************
     
     a = np.array(matrix)
-    axs = axs.flatten()
     im = axs[f].imshow(a, cmap='viridis', interpolation='nearest') # cmap='hot'
 
     delta_stat = np.max(matrix)-np.min(matrix)
@@ -131,14 +121,13 @@ def heat_map(deviations, f, heat_map, axs, matrix, filename, bar_title):
     cbar = heat_map.colorbar(im, ax=axs[f], fraction=0.046, pad=0.03)
     cbar.ax.set_ylabel(bar_title, rotation=-90, va="bottom")
     
-    rows, cols = a.shape
-    for i in range(rows):
-        for j in range(cols):
-            text = axs[f].text(j, i, a[i, j], ha="center", va="center", color="w", fontsize=6)
+    text = axs[f].text # bind once; one attribute lookup instead of one per cell
+    for (i, j), label in np.ndenumerate(a):
+        text(j, i, label, ha="center", va="center", color="w", fontsize=6)
 
     return delta_stat, new_f
 
-def diagnose(set_list, path, q1, q2, standardize=standardize, analyze=analyze, heat_map=heat_map, 
+def diagnose(set_list, path, standardize=standardize, analyze=analyze, heat_map=heat_map,
                     get_change=get_changes, blockPrint=blockPrint, enablePrint=enablePrint):
 
     small_troughs_count = 0
@@ -152,23 +141,17 @@ def diagnose(set_list, path, q1, q2, standardize=standardize, analyze=analyze, h
     large_chamber_speeds = []
     large_chamber_dist = []
 
-    # trough heat map
-    rows = math.ceil(len(set_list) / 5) 
-    fig, axes = plt.subplots(rows, 5, figsize=(20, 4*rows), facecolor='w', edgecolor='k')
-    fig.tight_layout(pad=6.0)
-
-    # speed and distance heat map
-    r = rows * 2
-    hmap, haxes = plt.subplots(r, 5, figsize=(20, 4*r), facecolor='w', edgecolor='k')
-    hmap.tight_layout(pad=6.0)
+    # panels are queued during the compute pass and drawn afterwards, so the figures
+    # are sized to the files that actually changed instead of the whole set
+    trough_panels = []
+    stat_panels = []
 
-    f=0
-    h=0
+    total = 0
     big_list =[]
 
+    start = time.time()
+
     for file in set_list:
-        
-        start = time.time()
 
         file_path = path + str(file)
         set_n = file.split("_")[1].split("-")[0]
@@ -182,38 +165,50 @@ def diagnose(set_list, path, q1, q2, standardize=standardize, analyze=analyze, h
         n_combos = len(devs)**2
         print(f"     Calculating...{file_abbrev}, {n_combos} troughs, speeds, and distances")
 
+        # parse the recording once; every deviation combo reuses the same arrays
+        data = np.loadtxt(file_path, delimiter=',', usecols=(0, 1), dtype=np.float32, encoding='latin-1')
+        time_col, volt_col = data[:, 0], data[:, 1]
+
+        rounded, channel_mean = _prep(volt_col) # shared by all deviation combos
+
+        blockPrint() # silence the analysis chatter once per file, not per combo
+
         for min_dev_val in devs:
-            
+
             troughs = []
             speeds = []
             distances = []
 
             for max_dev_val in devs:
-                
-                (time_col, trough_col) = standardize(file_path, min_dev_val, max_dev_val, trough_standardization)
-                
-                blockPrint() # temp
+
+                trough_col = standardize(rounded, channel_mean, min_dev_val, max_dev_val, _standardize)
                 (avg_speed, total_dist) = analyze(time_col, trough_col, time_list, speed_list, distance)
-                enablePrint() # temp
-                
-                troughs.append(sum(trough_col))
+
+                troughs.append(trough_col.sum())
                 speeds.append(avg_speed)
                 distances.append(total_dist)
 
             all_troughs.append(troughs)
             all_speeds.append(speeds)
             all_distances.append(distances)
-        
-        delta_trough, nf = heat_map(devs, f, fig, axes, all_troughs, file, "Number of Troughs")
-        f+=1
-        delta_speed, nh = heat_map(devs, h, hmap, haxes, all_speeds, file, "Average Speed (m/s)")
-        h+=1
-        delta_dist, nh = heat_map(devs, h, hmap, haxes, all_distances, file, "Distance (m/s)")
-        h+=1
 
-        troughs_flat = sum(all_troughs, [])
-        speeds_flat = sum(all_speeds, [])
-        distances_flat = sum(all_distances, [])
+        enablePrint()
+
+        delta_trough = np.max(all_troughs) - np.min(all_troughs)
+        delta_speed = np.max(all_speeds) - np.min(all_speeds)
+        delta_dist = np.max(all_distances) - np.min(all_distances)
+
+        if delta_trough > 0:
+            trough_panels.append((all_troughs, file))
+        if delta_speed > 0:
+            stat_panels.append((all_speeds, file, "Average Speed (m/s)"))
+        if delta_dist > 0:
+            stat_panels.append((all_distances, file, "Distance (m/s)"))
+
+        # chain instead of sum(list, []), which reallocates a growing list per row
+        troughs_flat = list(itertools.chain.from_iterable(all_troughs))
+        speeds_flat = list(itertools.chain.from_iterable(all_speeds))
+        distances_flat = list(itertools.chain.from_iterable(all_distances))
 
         stat_dict = {"trough": troughs_flat, "speed": speeds_flat, "distance": distances_flat}
         stats = ["trough", "speed", "distance"]
@@ -226,10 +221,8 @@ def diagnose(set_list, path, q1, q2, standardize=standardize, analyze=analyze, h
             row_combo["filename"] = file_abbrev
             row_combo["set"] = set_n.split("t0")[-1]
 
-            i = 0
-            for val in stat_dict[stat]:
-                i += 1
-                row_combo[f"combo_{i}"] = val
+            vals = stat_dict[stat]
+            row_combo.update(zip(COMBO_KEYS[:len(vals)], vals))
 
             combo_list.append(row_combo)
 
@@ -239,7 +232,7 @@ def diagnose(set_list, path, q1, q2, standardize=standardize, analyze=analyze, h
         ds_small, ds_large, cs_id = get_changes(file, delta_speed, "speed")
         dd_small, dd_large, cd_id = get_changes(file, delta_dist, "distance")
 
-        total = f
+        total += 1
 
         small_troughs_count += dt_small
         large_troughs_count += dt_large
@@ -251,10 +244,26 @@ def diagnose(set_list, path, q1, q2, standardize=standardize, analyze=analyze, h
         large_chamber_troughs.append(ct_id)
         large_chamber_speeds.append(cs_id)
         large_chamber_dist.append(cd_id)
-        
-        end = time.time()
-        minutes = round((end - start)/60, 2)
-        print(f"     Time elapsed: {minutes} min")
+
+    # one aggregated timing line per set instead of a stdout write per file
+    minutes = round((time.time() - start)/60, 2)
+    print(f"     {set_n}: {total} files in {minutes} min")
+
+    # trough heat map, sized to the queued panels only
+    rows = max(math.ceil(len(trough_panels) / 5), 1)
+    fig, axes = plt.subplots(rows, 5, figsize=(20, 4*rows), facecolor='w', edgecolor='k')
+    fig.tight_layout(pad=6.0)
+    axes = axes.flatten() # flatten once per figure, not once per heat_map call
+    for f, (matrix, filename) in enumerate(trough_panels):
+        heat_map(devs, f, fig, axes, matrix, filename, "Number of Troughs")
+
+    # speed and distance heat map
+    r = max(math.ceil(len(stat_panels) / 5), 1)
+    hmap, haxes = plt.subplots(r, 5, figsize=(20, 4*r), facecolor='w', edgecolor='k')
+    hmap.tight_layout(pad=6.0)
+    haxes = haxes.flatten()
+    for h, (matrix, filename, bar_title) in enumerate(stat_panels):
+        heat_map(devs, h, hmap, haxes, matrix, filename, bar_title)
 
     no_change_troughs = total - (small_troughs_count + large_troughs_count)
     no_change_speeds = total - (small_speeds_count + large_speeds_count)
@@ -291,50 +300,19 @@ def diagnose(set_list, path, q1, q2, standardize=standardize, analyze=analyze, h
     fig.savefig(outpath + f"trough_diagnostic-{set_n}.png")
     hmap.savefig(outpath + f"stats_diagnostics-{set_n}.png")
 
-    #return rows
-    q1.put(trows)
-    q2.put(big_list)
+    return trows, big_list
 
 def generate_set_lists(dir_list):
-    
-    # Rearranging the directory_list into list of files by set. 
-    
-    max_set_num = int(dir_list[-1].split("_")[1].split("-")[0].split("t0")[-1])
-
-    sets = []
-    for i in range(1, max_set_num + 1):
-        if i < 10:
-            s=f"00{i}"
-        else:
-            s=f"0{i}"
-        set_name = f"set{s}"
-        set_list = []
-        for file in dir_list:
-            if set_name in file:
-                set_list.append(file)
-        if set_list != []:
-            sets.append(set_list)
-
-    return sets
-
-def write_summary_file(out_path, three_rows):
-
-    with open(out_path + "diagnostics_summary.csv", "a+") as out_file: 
-        writer = csv.DictWriter(out_file, fieldnames = three_rows[0].keys())
-        if out_file.tell() == 0:
-            writer.writeheader()
-        for row in three_rows:
-            writer.writerow(row)
-
-def write_combos_file(out_path, combos):
-
-    with open(out_path + "diagnostics_combos.csv", "a+") as out_file:
-        writer = csv.DictWriter(out_file, fieldnames = combos[0][0].keys())
-        if out_file.tell() == 0:
-            writer.writeheader()
-        for file in combos:
-            for row in file:
-                writer.writerow(row)
+
+    # Rearranging the directory_list into list of files by set. One pass parsing the set
+    # name out of each filename replaces a scan of the whole directory per set number.
+
+    groups = defaultdict(list)
+    for file in dir_list:
+        set_name = file.split("_")[1].split("-")[0]
+        groups[set_name].append(file)
+
+    return [groups[set_name] for set_name in sorted(groups)]
 
 #************************************************************************************************************
 #   To call the recording data file, write the complete file directory path below. An example path is
@@ -342,8 +320,6 @@ def write_combos_file(out_path, combos):
 #   of channels used to record the flight data. For individual insects with only two columns per file,
 #   only the TBF and voltage reading columns are processed. However, if the number of channels is different
 #   the script needs to be edited accordingly.
-#
-#   Max number of items to population a Queue: 32767 items. (Stack Overflow: Multiprocessing Queue maxsize limit is 32767)
 #************************************************************************************************************
 
 if __name__ == "__main__":
@@ -364,25 +340,26 @@ if __name__ == "__main__":
 
     outpath = r"/home/avbernat/Desktop/diagnostics/"
     #outpath = r"/Users/anastasiabernat/Desktop/"
-    with open(os.path.join(outpath, "diagnostics_summary.csv"), 'w') as file_out: 
-        pass
-    with open(os.path.join(outpath, "diagnostics_combos.csv"), 'w') as file_out: 
-        pass
-
-    qout = mp.Queue()
-    qbig = mp.Queue()
-    jobs = []
-    for set_list in sets:
-        set_num = set_list[0].split("_")[1].split("-")[0]
-        print("\n", f"Job for {set_num} started!")
-        p = mp.Process(target=diagnose, args=(set_list, path, qout, qbig))
-        jobs.append(p)
-        p.start()
-
-    for process in jobs:
-        set_rows = qout.get()
-        set_combos = qbig.get()
-        write_summary_file(outpath, set_rows)
-        write_combos_file(outpath, set_combos)
-        # process.join() # set 12 and 15 gets stuck in an infinite loop if uncomment
-        # sys.stdout.flush() # https://stackoverflow.com/questions/10019456/usage-of-sys-stdout-flush-method
+
+    summary_fields = ["stat", "set", "total", "no_change", "small_changes",
+                      "large_changes", "large_prop", "large_cIDs"]
+    combo_fields = ["stat", "filename", "set"] + list(COMBO_KEYS)
+
+    # a pool caps concurrency at the core count instead of one process per set, and
+    # imap_unordered streams each set's rows back as soon as it finishes. The output
+    # files are opened once with their headers written up front, so each set only
+    # appends rows instead of reopening the CSVs and probing for a header.
+    worker = partial(diagnose, path=path)
+    with open(os.path.join(outpath, "diagnostics_summary.csv"), 'w') as summary_out, \
+         open(os.path.join(outpath, "diagnostics_combos.csv"), 'w') as combos_out:
+
+        summary_writer = csv.DictWriter(summary_out, fieldnames=summary_fields)
+        summary_writer.writeheader()
+        combos_writer = csv.DictWriter(combos_out, fieldnames=combo_fields)
+        combos_writer.writeheader()
+
+        with mp.Pool(processes=os.cpu_count()) as pool:
+            for set_rows, set_combos in pool.imap_unordered(worker, sets):
+                summary_writer.writerows(set_rows)
+                for combo_list in set_combos:
+                    combos_writer.writerows(combo_list)
@@ -3,11 +3,26 @@ import sys
 import csv
 import re
 import time
+import itertools
 
+import numpy as np
+import multiprocessing as mp
+
+from functools import partial
 from matplotlib import pyplot as plt
 from flight_traj import color_palette, plot_trajectories
 
-start = time.time()
+try: # numba is optional - compute_flight falls back to the numpy functions without it
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+    def njit(*args, **kwargs):
+        def wrap(func):
+            return func
+        return wrap
+
+ARM_CIRCUMFERENCE = 0.6283 # * meters of circular flight path per rotation (2*pi*R with R ~ 10cm)
 
 #**********************************************************************************************
 # Call blockPrint() before function to disable print statements. Call enableprint() when want
@@ -32,12 +47,12 @@ def time_list(time, channel):
     #
     #***************************************************************************************************************************
 
-    time_channel=[]
-    for i in range(0, len(channel)):
-        if float(channel[i]) == 1.00:
-            time_channel.append(float(time[i]))
+    time_arr = np.asarray(time, dtype=np.float64)
+    channel_arr = np.asarray(channel, dtype=np.float64)
 
-    return time_channel
+    # flatnonzero extracts the sparse trough index set; on mostly-idle channels
+    # this touches a handful of indices instead of masking the full recording
+    return time_arr[np.flatnonzero(channel_arr == 1.00)]
 
 def speed_list(time):
     
@@ -65,22 +80,15 @@ def speed_list(time):
     #
     #***************************************************************************************************************************
 
-    speed_t=0
-    speed_channel=[]
-    speed_channel.append(0)
-    
+    speed_channel = np.zeros(1)
+
     if len(time) > 0:
         if len(time) > 2:
-            for i in range(1, len(time)):
-                if float(time[i]) != float(time[i-1]):
-                    speed_t = 0.6283/(float(time[i]) - float(time[i-1])) # *
-                    speed_channel.append(float(speed_t))
-                else:
-                    speed_channel.append(9999) 
-            
-            for x in range(0, len(speed_channel)): # Optional speed correction.
-                if float(speed_channel[x]) < 0.1: 
-                    speed_channel[x] = 0
+            dt = np.diff(np.asarray(time, dtype=np.float64))
+            speed_t = np.where(dt != 0, ARM_CIRCUMFERENCE/np.where(dt == 0, 1.0, dt), 9999.0) # *
+            speed_channel = np.concatenate(([0.0], speed_t))
+
+            speed_channel[speed_channel < 0.1] = 0 # Optional speed correction.
 
         else:
             print ("Has only one peak - impossible to calculate motion stats")
@@ -125,37 +133,142 @@ def distance(time, speed):
     maxspeeds = []
 
     if len(time) > 2:
-        
-        for i in range(1, len(speed)):
-            # if i == 2:
-            #     maxtimes.append(time[i])
-            #     maxspeeds.append(speed[i])
-            if float(speed[i]) > 0.75:
-                maxtimes.append(time[i])
-                maxspeeds.append(speed[i])
-                #print(float(time[i]), float(speed[i]))
-            if float(speed[i]) > 0 and float(speed[i]) < 0.75: # Modify the threshold value accordingly
-                time_new.append(float(time[i]))
-                speed_new.append(float(speed[i]))
-                distance += 0.6283
+
+        t = np.asarray(time, dtype=np.float64)[1:]
+        s = np.asarray(speed, dtype=np.float64)[1:]
+
+        hi = s > 0.75
+        maxtimes = t[hi]
+        maxspeeds = s[hi]
+
+        lo = (s > 0) & (s < 0.75) # Modify the threshold value accordingly
+        time_new = t[lo]
+        speed_new = s[lo]
+        distance = ARM_CIRCUMFERENCE * lo.sum()
 
         if len(time_new) > 2:
-            time_final.append(time_new[0])
-            speed_final.append(speed_new[0])
-            for j in range(0, len(time_new)-1):
-                if float(time_new[j+1]) - float(time_new[j]) <= 7: # The gap value can be changed accordingly
-                    time_final.append(time_new[j+1])
-                    speed_final.append(speed_new[j+1])
-            average_speed = sum(speed_final)/len(speed_final)
-            
+            # the first point is always kept; later points survive gaps of at most 7s
+            keep = np.concatenate(([True], np.diff(time_new) <= 7)) # The gap value can be changed accordingly
+            time_final = time_new[keep]
+            speed_final = speed_new[keep]
+            average_speed = speed_final.mean()
+
         else:
             print('Cannot calculate distance and average speed')
     else:
         print('Cannot calculate distance and average speed')
         
-    return (time_final, speed_final, distance, average_speed, maxtimes, maxspeeds)  
+    return (time_final, speed_final, distance, average_speed, maxtimes, maxspeeds)
+
+
+@njit(cache=True)
+def _compute_flight(time_arr, trough_arr):
+
+    #***************************************************************************************************************************
+    #
+    # Fused kernel behind compute_flight: selects the trough times, derives the speeds, and applies the distance
+    # thresholds and gap filter in one traversal, so the channel data is read once instead of three times. Only
+    # called for channels with more than two troughs; the messages for the degenerate cases live in compute_flight.
+    #
+    #***************************************************************************************************************************
+
+    n = time_arr.shape[0]
+
+    m = 0
+    for i in range(n):
+        if trough_arr[i] == 1.00:
+            m += 1
+
+    t = np.empty(m, dtype=np.float64)
+    k = 0
+    for i in range(n):
+        if trough_arr[i] == 1.00:
+            t[k] = time_arr[i]
+            k += 1
+
+    maxtimes = np.empty(m, dtype=np.float64)
+    maxspeeds = np.empty(m, dtype=np.float64)
+    time_new = np.empty(m, dtype=np.float64)
+    speed_new = np.empty(m, dtype=np.float64)
+    hi = 0
+    lo = 0
+
+    for i in range(1, m):
+        dt = t[i] - t[i-1]
+        v = 9999.0 if dt == 0 else ARM_CIRCUMFERENCE / dt # *
+        if v < 0.1: # Optional speed correction.
+            v = 0.0
+        if v > 0.75:
+            maxtimes[hi] = t[i]
+            maxspeeds[hi] = v
+            hi += 1
+        if 0 < v < 0.75: # Modify the threshold value accordingly
+            time_new[lo] = t[i]
+            speed_new[lo] = v
+            lo += 1
+
+    dist = ARM_CIRCUMFERENCE * lo
+
+    time_final = np.empty(lo, dtype=np.float64)
+    speed_final = np.empty(lo, dtype=np.float64)
+    nf = 0
+    average_speed = 0.0
+
+    if lo > 2:
+        time_final[0] = time_new[0]
+        speed_final[0] = speed_new[0]
+        nf = 1
+        for j in range(lo - 1):
+            if time_new[j+1] - time_new[j] <= 7: # The gap value can be changed accordingly
+                time_final[nf] = time_new[j+1]
+                speed_final[nf] = speed_new[j+1]
+                nf += 1
+        total = 0.0
+        for j in range(nf):
+            total += speed_final[j]
+        average_speed = total / nf
+
+    return (time_final[:nf], speed_final[:nf], dist, average_speed, maxtimes[:hi], maxspeeds[:hi])
+
+
+def compute_flight(time_column, trough_column):
+
+    #***************************************************************************************************************************
+    #
+    # Runs time_list, speed_list, and distance as one fused pass over the channel.
+    #
+    # INPUT:    Time and trough columns as arrays of floats.
+    #
+    # OUTPUT:   The same six values distance returns: the filtered time and speed lists, the total distance,
+    #           the average speed, and the max-speed times and speeds.
+    #
+    #***************************************************************************************************************************
+
+    time_arr = np.asarray(time_column, dtype=np.float64)
+    trough_arr = np.asarray(trough_column, dtype=np.float64)
+
+    if not HAS_NUMBA: # without the JIT the fused loops would be slower than the numpy functions
+        time_channel = time_list(time_arr, trough_arr)
+        speed_channel = speed_list(time_channel)
+        return distance(time_channel, speed_channel)
+
+    # the sparse index set decides up front whether the channel is worth a full pass
+    m = np.flatnonzero(trough_arr == 1.00).size
+    if m == 0:
+        print ("Channel is empty")
+    elif m <= 2:
+        print ("Has only one peak - impossible to calculate motion stats")
+    if m <= 2:
+        print('Cannot calculate distance and average speed')
+        return ([], [], 0, 0, [], [])
+
+    result = _compute_flight(time_arr, trough_arr)
+    if len(result[0]) == 0:
+        print('Cannot calculate distance and average speed')
+
+    return result
+
 
-  
 def recording_duration(file_path):
     
     #***************************************************************************************************************************
@@ -164,16 +277,20 @@ def recording_duration(file_path):
     #
     # INPUT:    File path as a string.
     #
-    # PROCESS:  The function reads all the data, splits the data out as a list of strings (each string is a row), retrieves
-    #           the last line of the data, and gets the first element in the list of strings, which is the recording duration.
+    # PROCESS:  Only the first and last timestamps are needed, so the function reads the first line and then seeks
+    #           to just before the end of the file for the last line instead of materializing the whole recording.
     #
     # OUTPUT:   The file's recording duration as a float.
     #
     #***************************************************************************************************************************
-  
-    with open(file_path, "r") as txtfile:
-        data = txtfile.readlines()         
-        tot_duration = float(data[-1].split(",")[0]) - float(data[0].split(",")[0])
+
+    with open(file_path, "rb") as txtfile:
+        first = txtfile.readline()
+        size = txtfile.seek(0, os.SEEK_END)
+        txtfile.seek(max(size - 4096, 0))
+        last = txtfile.read().splitlines()[-1]
+
+    tot_duration = float(last.split(b",")[0]) - float(first.split(b",")[0])
 
     return tot_duration
 
@@ -186,49 +303,30 @@ def flying_bouts(time, speed, recording_duration):
     #
     # INPUT:    Fltered time and speed lists as well as the total duration of the flight recording.
     #
-    # PROCESS:  Part 1. The time difference between troughs are assessed. If the difference between the second and the first
-    #           times are less than 20 seconds, then the first time value is stored in the bout_time list because it indicates
-    #           the start of the first bout. However, if they are more than 20 seconds then each time is a different bout
-    #           and their differences are evaluated like all other time differences. Thus, any consecutive time gap that
-    #           is greater than 20 seconds will have both values are appended to bout_time where the the earlier value
-    #           indicates the end of one bout and the later value indicates the beginning of new bout. The last time value
-    #           is also stored in bout_time in order to store the end time value of the last bout.
-    #
-    #           Part 2. To calculate the bout durations, the even index values are subtracted by the odd index values of the
-    #           bout_list since they indicate the final and initial times of the bout. Then, the total time spent flying is
-    #           calculated by taking the sum of the bout durations. The total percentage spent flying is also calculated as
-    #           well as the longest bout. Finally, a series of specific duration ranges are use to calculate the number of
-    #           bout events, the percentage of total flight time, and the total duration within the range. Below, the bout
-    #           durations were set at ranges 60-300s, 300-900s, 900-3600s, 3600-14400s and >14400s.
+    # PROCESS:  Part 1. The gaps between consecutive trough times are taken with np.diff; any gap of 20 seconds or
+    #           more ends one bout and starts the next. The first time value opens the first bout and the last time
+    #           value closes the last bout, so each bout's duration is simply its end time minus its start time.
+    #
+    #           Part 2. The total time spent flying is calculated by taking the sum of the bout durations. The total
+    #           percentage spent flying is also calculated as well as the longest bout. Finally, a series of specific
+    #           duration ranges are use to calculate the number of bout events, the percentage of total flight time,
+    #           and the total duration within the range. Below, the bout durations were set at ranges 60-300s,
+    #           300-900s, 900-3600s, 3600-14400s and >14400s.
     #
     # OUTPUT:   Returns all flight statistics calculated in Part 2.
     #
     #***************************************************************************************************************************
     
-    bout_time = [] 
-    
-    t_odd = []
-    t_even = []
-    bout_durations = [] 
-    
-    last_time = 0
-    diff = 0
     flight_time = 0
     longest_bout = 0
     shortest_bout = 0
     
     
-    fly_time=0 
-    flight_60_300=[]
+    fly_time=0
     sum_60_300=0
-    flight_300_900=[]
     sum_300_900=0
-    flight_900_3600=[]
     sum_900_3600=0
-    flight_3600_14400=[]
     sum_3600_14400=0
-    flight_14400=[]
-    
     sum_14400=0
     events_300=0
     events_900=0
@@ -239,75 +337,37 @@ def flying_bouts(time, speed, recording_duration):
     if len(time) > 2:
         
         #*********************************************************************************
-        # Part 1. Identifying and storing the beginning and end time values of each bout.
+        # Part 1. Identifying the beginning and end time values of each bout.
         #*********************************************************************************
 
-        if float(time[1]) - float(time[0]) < 20: 
-            bout_time.append(time[0])
-
-        for i in range(0, len(time)-1):
-            if float(time[i+1]) - float(time[i]) >= 20: 
-                bout_time.append(time[i])
-                bout_time.append(time[i+1])
-     
-        if bout_time[-1] != time[-1]:
-            bout_time.append(time[-1])
-
-        for t in range(1, len(bout_time)):
-            bout_time = sorted(list(set(bout_time))) # set() removes redundant values
+        t = np.asarray(time, dtype=np.float64)
+        gap = np.flatnonzero(np.diff(t) >= 20) # a 20s gap ends one bout and starts the next
+        starts = t[np.concatenate(([0], gap + 1))]
+        ends = t[np.concatenate((gap, [len(t) - 1]))]
+        bout_durations = ends - starts
 
         #*********************************************************************************
         # Part 2: Calculates the flight descriptive statistics.
         #*********************************************************************************
 
-        if len(bout_time)%2 != 0: 
-            last_time = float(bout_time[-1])
-            del bout_time[-1]
+        flight_time = bout_durations.sum()
+        fly_time = flight_time/recording_duration
+        longest_bout = bout_durations.max()
+                
+        # one branchless histogram pass instead of the five-way elif chain;
+        # durations of 60s or less fall in bin 0 and are ignored, as before
+        edges = np.array([60.0, 300.0, 900.0, 3600.0, 14400.0])
+        bins = np.digitize(bout_durations, edges, right=True) # (60,300] -> 1, ..., >14400s -> 5
+        counts = np.bincount(bins, minlength=6)
+        sums = np.bincount(bins, weights=bout_durations/flight_time, minlength=6)
 
-        t_odd = bout_time[0::2] 
-        t_even = bout_time[1::2] 
-        for j in range(0, len(t_odd)):
-            diff = float(t_even[j]) - float(t_odd[j])
-            bout_durations.append(diff) 
+        sum_60_300, sum_300_900, sum_900_3600, sum_3600_14400, sum_14400 = sums[1:6]
+        events_300, events_900, events_3600, events_14400, events_more_14400 = counts[1:6]
 
-        if float(last_time) != 0: 
-            diff = float(last_time) - float(t_even[-1])
-            bout_durations.append(diff)
+        in_60_300 = bout_durations[bins == 1]
+        if in_60_300.size > 0:
+            shortest_bout = in_60_300.min()
 
-        flight_time = sum(float(i) for i in bout_durations)
-        fly_time = flight_time/recording_duration
-        longest_bout = max(bout_durations)
-                
-        for k in range(0, len(bout_durations)): 
-            if float(bout_durations[k])>60 and float(bout_durations[k])<=300:
-                flight_60_300.append(float(bout_durations[k])/flight_time)
-            elif float(bout_durations[k])>300 and float(bout_durations[k])<=900:
-                flight_300_900.append(float(bout_durations[k])/flight_time)
-            elif float(bout_durations[k])>900 and float(bout_durations[k])<=3600:
-                flight_900_3600.append(float(bout_durations[k])/flight_time)
-            elif float(bout_durations[k])>3600 and float(bout_durations[k])<=14400:
-                flight_3600_14400.append(float(bout_durations[k])/flight_time)
-            elif float(bout_durations[k])>14400:
-                flight_14400.append(float(bout_durations[k])/flight_time)
-                
-        if len(flight_60_300) > 0:
-            sum_60_300=sum(float(a) for a in flight_60_300)
-            shortest_bout = float(min(flight_60_300))*flight_time
-        if len(flight_300_900) > 0:
-            sum_300_900=sum(float(b) for b in flight_300_900)
-        if len(flight_900_3600) > 0:
-            sum_900_3600=sum(float(c) for c in flight_900_3600)
-        if len(flight_3600_14400) > 0:
-            sum_3600_14400=sum(float(d) for d in flight_3600_14400)
-        if len(flight_14400) > 0:
-            sum_14400=sum(float(e) for e in flight_14400)
-            
-        events_300=len(flight_60_300)
-        events_900=len(flight_300_900)
-        events_3600=len(flight_900_3600)
-        events_14400=len(flight_3600_14400)
-        events_more_14400=len(flight_14400)
-        
     else:
         print('Channel has only one peak - cannot perform calculation')
 
@@ -335,34 +395,139 @@ def graph(time, speed):
     #
     #**********************************************************************************************
 
-    time_new=[]
-    speed_new=[]
-    x=0
-    y=0
-    for i in range(0, len(time)-1):
-        if float(time[i+1]) - float(time[i]) > 20:
-            time_new.append(time[i])
-            speed_new.append(speed[i])
-            x=float(time[i]) + 1
-            time_new.append(x)
-            speed_new.append(0)
-            y=float(time[i+1]) -1
-            time_new.append(y)
-            speed_new.append(0)
-        else:
-            time_new.append(time[i])
-            speed_new.append(speed[i])
-    time_new.append(0)
-    speed_new.append(0)
-    
+    time_arr = np.asarray(time, dtype=np.float64)
+    speed_arr = np.asarray(speed, dtype=np.float64)
+
+    n = time_arr.size
+
+    # two synthetic zero-speed points go after every gap of more than 20s, so the
+    # output length is known up front and both arrays are allocated exactly once;
+    # empty channels still get the length-1 (0, 0) terminator
+    gap_idx = np.flatnonzero(np.diff(time_arr) > 20)
+    out_len = max(n - 1, 0) + 2 * gap_idx.size + 1
+    time_new = np.zeros(out_len)
+    speed_new = np.zeros(out_len)
+
+    # each original point shifts right by 2 for every gap before it
+    inc = np.zeros(n, dtype=np.int64)
+    inc[gap_idx + 1] = 2
+    dest = np.arange(n - 1) + np.cumsum(inc)[:-1]
+    time_new[dest] = time_arr[:-1]
+    speed_new[dest] = speed_arr[:-1]
+
+    # the k-th gap's synthetic pair lands right after its point plus the 2k earlier insertions;
+    # their speeds, and the trailing (0, 0) terminator that stands in for the never-emitted
+    # last point, are already zero from the allocation
+    pair = gap_idx + 1 + 2 * np.arange(gap_idx.size)
+    time_new[pair] = time_arr[gap_idx] + 1
+    time_new[pair + 1] = time_arr[gap_idx + 1] - 1
+
     return time_new, speed_new
 
+def process_file(file, path):
+
+    #**********************************************************************************************
+    #
+    # Runs the full per-file analysis for one standardized recording: parses the file, computes
+    # the flight statistics, and prepares the trajectory data. Files are independent, so this is
+    # the unit of work handed to the process pool. Plotting stays in the main process; the worker
+    # returns the (time, speed) trajectory along with its labels instead of touching the figure.
+    #
+    # OUTPUT:   A dict of flight statistics for the summary file, the (time, speed, ID) rows for
+    #           the max speeds file, and the arguments needed to plot the flight trajectory.
+    #
+    #**********************************************************************************************
+
+    filepath = path + str(file)
+    tot_duration = recording_duration(filepath)
+
+    # C parser loads both columns straight into float arrays
+    data = np.loadtxt(filepath, delimiter=",", usecols=(0, 1), dtype=np.float64)
+    time_column, trough_column = data[:, 0], data[:, 1]
+
+    row_data = {}
+
+    # Filename String Manipulation: Channel Letters, Channel Numbers, and IDs
+
+    ID = str(file).split("_")[-1].replace(".txt", "")
+    row_data["ID"] = ID
+    print("ID: ", row_data["ID"])
+    filename = str(file).split("_")[2].replace(".txt", "") + "_" + ID + '.txt'
+    row_data['filename'] = filename
+    set_number = filename.split("-")[0].split("t0")[-1]
+    channel_chamber = str(file).split("-")[-1].split("_")[0]
+    channel_chamber = re.findall('\d+|\D+', channel_chamber)
+    channel_chamber = str(channel_chamber[0]) + "-" + str(channel_chamber[1])
+    channel_letter = channel_chamber[0]
+    channel_num = channel_chamber[2]
+    trial_type = str(file).split("_")[1]
+    row_data['trial_type'] = trial_type
+    row_data["chamber"] = channel_chamber
+    row_data["channel_letter"] = channel_letter
+    row_data["channel_num"] = channel_num
+
+    # Function Calculations and Print Statements
+
+    print('CHANNEL ' + channel_num + ' -------------------------------------------')
+    time_n, speed_n, dist, av_speed, mtimes, mspeeds = compute_flight(time_column, trough_column)
+
+    fly_time, short_bout, long_bout, flight, fly_to_300, fly_to_900,  \
+        fly_to_3600, fly_to_14400, fly_more_14400, event_300, event_900, event_3600, \
+        event_14400, event_more_14400 = flying_bouts(time_n, speed_n, tot_duration)
+
+    print('Average speed (m/s) -> ' + '%.2f' % av_speed)
+    print('Total flight time (s) -> ' + '%.2f' % fly_time)
+    print('Distance (m) -> ' + '%.2f' % dist)
+    print('Shortest flying bout (s) -> ' + '%.2f' % short_bout)
+    print('Longest flying bout (s) -> ' + '%.2f' %long_bout)
+    print('This individual spent ' + '%.3f' %flight + ' of its time flying with this composition: ')
+    print('  60s-300s = ' + '%.3f' %fly_to_300 + ' with ',event_300, 'events')
+    print('  300s-900s = ' + '%.3f' %fly_to_900 + ' with ',event_900, 'events')
+    print('  900s-3600s = ' + '%.3f' %fly_to_3600 + ' with ',event_3600, 'events')
+    print('  3600s-14400s = ' + '%.3f' %fly_to_14400 + ' with ',event_14400, 'events')
+    print('  +14400s = ' + '%.3f' %fly_more_14400 + ' with ',event_more_14400, 'events')
+    print('\n')
+
+    time_graph, speed_graph = graph(time_n, speed_n)
+
+    # Flight Stats:
+
+    row_data["set_number"] = set_number
+    row_data['average_speed'] = round(av_speed, 2)
+    row_data['total_flight_time'] = round(fly_time, 2)
+    row_data['distance'] = round(dist,2)
+    row_data['shortest_flying_bout'] = round(short_bout, 2)
+    row_data['longest_flying_bout'] = round(long_bout, 2)
+    row_data['portion_flying'] = round(flight, 2)
+    row_data['recording_duration'] = round(tot_duration, 2)
+    #row_data['max_speed'] = round(max(speed_graph), 2)
+
+    # linear-time selection of the top speeds instead of sorting the whole trajectory;
+    # the plotted trajectory itself stays in time order
+    k = min(len(speed_graph), 10)
+    top10 = np.sort(np.partition(speed_graph, -k)[-k:])[::-1]
+
+    row_data['max_speed1'] = round(top10[0],2)
+
+    if len(speed_graph) >= 10:
+        row_data['max_speed2'] = round(top10[1],2)
+        row_data['max_speed3'] = round(top10[2],2)
+        row_data['max_speed4'] = round(top10[3],2)
+        row_data['max_speed10'] = round(top10[9],2)
+
+    mrows = list(zip(mtimes, mspeeds, [ID] * len(mtimes)))
+    plot_args = (time_graph, speed_graph, filename, ID, set_number, channel_letter + channel_num)
+
+    return row_data, mrows, plot_args
+
 #************************************************************************************************************
 # Call the flight data files by defining the filepath folder.
 #************************************************************************************************************
 
-if __name__=="__main__":
-    
+def main():
+
+    start = time.time()
+
     filepath = "/Users/anastasiabernat/Desktop/Dispersal/Trials-Winter2020/all_flight_data.csv"
     flight_type_dict, sex_dict, pop_dict, mass_dict, host_dict = color_palette(filepath)
 
@@ -372,127 +537,48 @@ if __name__=="__main__":
     dir_list = sorted(os.listdir(path))
     print(path, "\n")
     
-    plt.figure()
+    fig, ax = plt.subplots() # one Figure reused across every file
+    ax.set_title('Flight Trajectories')
+    ax.set_xlabel('Seconds from start')
 
-    big_list=[]
     max_list=[]
-    for file in dir_list:
-        filepath = path + str(file)
-        tot_duration = recording_duration(filepath)
-
-        input_file = open(filepath, mode="r")
-        data_list = list(input_file)
-        
-        time_column = []
-        trough_column = []
-        
-        for i in range(0, len(data_list)):
-            raw = data_list[i]
-            a,b = raw.split(",") 
-            time_column.append(a)
-            trough_column.append(b)
-         
-        input_file.close()
-
-        output_data = []
-        row_data = {}
-
-        # Filename String Manipulation: Channel Letters, Channel Numbers, and IDs
-        
-        ID = str(file).split("_")[-1].replace(".txt", "")
-        row_data["ID"] = ID
-        print("ID: ", row_data["ID"])         
-        filename = str(file).split("_")[2].replace(".txt", "") + "_" + ID + '.txt'
-        row_data['filename'] = filename
-        set_number = filename.split("-")[0].split("t0")[-1]
-        channel_chamber = str(file).split("-")[-1].split("_")[0]
-        channel_chamber = re.findall('\d+|\D+', channel_chamber)
-        channel_chamber = str(channel_chamber[0]) + "-" + str(channel_chamber[1])
-        channel_letter = channel_chamber[0]
-        channel_num = channel_chamber[2]
-        trial_type = str(file).split("_")[1]
-        row_data['trial_type'] = trial_type
-        row_data["chamber"] = channel_chamber
-        row_data["channel_letter"] = channel_letter
-        row_data["channel_num"] = channel_num
-
-
-        # Function Calculations and Print Statements
-        
-        print('CHANNEL ' + channel_num + ' -------------------------------------------')
-        time_channel = time_list(time_column, trough_column)
-        speed_channel = speed_list(time_channel)
-        time_n, speed_n, dist, av_speed, mtimes, mspeeds = distance(time_channel, speed_channel)
-        
-        fly_time, short_bout, long_bout, flight, fly_to_300, fly_to_900,  \
-            fly_to_3600, fly_to_14400, fly_more_14400, event_300, event_900, event_3600, \
-            event_14400, event_more_14400 = flying_bouts(time_n, speed_n, tot_duration)
-        
-        print('Average speed (m/s) -> ' + '%.2f' % av_speed)
-        print('Total flight time (s) -> ' + '%.2f' % fly_time)
-        print('Distance (m) -> ' + '%.2f' % dist)
-        print('Shortest flying bout (s) -> ' + '%.2f' % short_bout)
-        print('Longest flying bout (s) -> ' + '%.2f' %long_bout)
-        print('This individual spent ' + '%.3f' %flight + ' of its time flying with this composition: ')
-        print('  60s-300s = ' + '%.3f' %fly_to_300 + ' with ',event_300, 'events')
-        print('  300s-900s = ' + '%.3f' %fly_to_900 + ' with ',event_900, 'events')
-        print('  900s-3600s = ' + '%.3f' %fly_to_3600 + ' with ',event_3600, 'events')
-        print('  3600s-14400s = ' + '%.3f' %fly_to_14400 + ' with ',event_14400, 'events')
-        print('  +14400s = ' + '%.3f' %fly_more_14400 + ' with ',event_more_14400, 'events')
-        print('\n')
-        
-        time_graph, speed_graph = graph(time_n, speed_n)
-        plot_trajectories(time_graph, speed_graph, plt, filename, ID, set_number, channel_letter + channel_num, 
-                                flight_type_dict, sex_dict, pop_dict, mass_dict, host_dict, main_path, 
-                                plot_spline=True, plot_speed=True, plot_acc=False, individual=False)
+    outpath = main_path
 
-        # Flight Stats:
+    # every stats row the workers can produce, so the header is known up front and
+    # rows missing the max-speed columns fall back to restval
+    fieldnames = ["ID", "filename", "trial_type", "chamber", "channel_letter", "channel_num",
+                  "set_number", "average_speed", "total_flight_time", "distance",
+                  "shortest_flying_bout", "longest_flying_bout", "portion_flying",
+                  "recording_duration", "max_speed1", "max_speed2", "max_speed3",
+                  "max_speed4", "max_speed10"]
 
-        row_data["set_number"] = set_number
-        row_data['average_speed'] = round(av_speed, 2)
-        row_data['total_flight_time'] = round(fly_time, 2)
-        row_data['distance'] = round(dist,2)
-        row_data['shortest_flying_bout'] = round(short_bout, 2)      
-        row_data['longest_flying_bout'] = round(long_bout, 2)        
-        row_data['portion_flying'] = round(flight, 2)
-        row_data['recording_duration'] = round(tot_duration, 2)
-        #row_data['max_speed'] = round(max(speed_graph), 2)
+    plot_queue = []
 
-        speed_graph.sort()
+    # every file is independent, so the pool fans them out across cores; each summary
+    # row streams to disk as its worker finishes, while the trajectory data is queued
+    # and rendered in one batch afterwards since the figure is not picklable
+    worker = partial(process_file, path=path)
+    with open(outpath + "flight_stats_summary5.csv", "w") as csv_file, mp.Pool(mp.cpu_count()) as pool:
 
-        max_speed1 = speed_graph[-1]
-        row_data['max_speed1'] = round(max_speed1,2)
+        writer = csv.DictWriter(csv_file, fieldnames=fieldnames, restval='')
+        writer.writeheader()
 
-        if len(speed_graph) >= 10:
-            max_speed2 = speed_graph[-2]
-            max_speed3 = speed_graph[-3]
-            max_speed4 = speed_graph[-4]
-            max_speed10 = speed_graph[-10]
-            row_data['max_speed2'] = round(max_speed2,2)
-            row_data['max_speed3'] = round(max_speed3,2)
-            row_data['max_speed4'] = round(max_speed4,2)
-            row_data['max_speed10'] = round(max_speed10,2)
+        for row_data, mrows, plot_args in pool.imap_unordered(worker, dir_list, chunksize=4):
 
-        big_list.append(row_data)
+            writer.writerow(row_data)
+            if len(mrows) > 0:
+                max_list.append(mrows)
+            plot_queue.append(plot_args)
 
-        rows = zip(mtimes, mspeeds, [ID] * len(mtimes))
-        if len(mtimes) > 0:
-            max_list.append(rows)
+    # render all trajectories in one batch now that the workers are done
+    for time_graph, speed_graph, filename, ID, set_number, channel in plot_queue:
+        plot_trajectories(time_graph, speed_graph, ax, filename, ID, set_number, channel,
+                                flight_type_dict, sex_dict, pop_dict, mass_dict, host_dict, main_path,
+                                plot_spline=True, plot_speed=True, plot_acc=False, individual=False)
 
     with open(main_path + "max_speeds2.csv", "w") as maxfile:
         writer = csv.writer(maxfile)
-        for zip_object in max_list:
-            for row in zip_object:
-                writer.writerow(row)
-   
-    # All Flight Stats Summary File
-
-    outpath = main_path
-    with open(outpath + "flight_stats_summary5.csv", "w") as csv_file:
-        writer = csv.DictWriter(csv_file, fieldnames = big_list[1].keys()) # supposed to be 0?
-        writer.writeheader()
-        for row in big_list:
-            writer.writerow(row)
+        writer.writerows(itertools.chain.from_iterable(max_list))
 
     #**********************************************************************************************
     # Time it takes to execute the code.
@@ -503,8 +589,12 @@ if __name__=="__main__":
     print("---",(end - start), "seconds ---")
     print("---",(end - start) / 60, "mintues ---")
 
-plt.savefig(outpath + "flight_trajectories.png", dpi=300, bbox_inches='tight')
-plt.clf()
+    # saved here in main() so pool workers importing the module never touch the figure
+    plt.savefig(outpath + "flight_trajectories.png", dpi=300, bbox_inches='tight')
+    plt.clf()
+
+if __name__=="__main__":
+    main()
 
 #**********************************************************************************************
 # This file has been modified from Attisano et al. 2015.
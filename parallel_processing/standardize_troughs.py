@@ -1,8 +1,54 @@
 import os
 import math
 import numpy as np
+import multiprocessing as mp
 import matplotlib.pyplot as plt
 
+from functools import partial
+
+try: # numba is optional - the kernel below runs as a plain Python loop without it
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        def wrap(func):
+            return func
+        return wrap
+
+_DEBUG = False # set True to print the per-call trough summary below
+
+@njit(cache=True)
+def _suppress_doubles(int_list, candidates, sample_rate):
+
+    #************************************************************************************************************
+    #
+    # Walks the sparse rising-edge candidates in order, marks each clean trough with a single 1, and erases
+    # false second troughs by zeroing the following sample_rate-long window (see the docstring in
+    # trough_standardization). Stateful branchy control flow, so numba compiles it when present.
+    #
+    #************************************************************************************************************
+
+    n = int_list.shape[0]
+    troughs = np.zeros(n, dtype=np.int8)
+    for k in range(candidates.shape[0]):
+        j = candidates[k]
+        while j != -1:
+            nxt = -1
+            if j < n - 1:
+                # check against the live array: an earlier zeroing window may have cleared this peak
+                if int_list[j] > int_list[j-1] and int_list[j] >= int_list[j+1]:
+                    if (int_list[j-3] >= int_list[j] or int_list[j-5] >= int_list[j]
+                            or int_list[j-7] >= int_list[j]): # double troughs
+                        end = min(j + sample_rate, n)
+                        for i in range(j, end):
+                            int_list[i] = 0
+                        if end < n:
+                            # zeroing can expose a fresh rising edge right at the window end
+                            nxt = end
+                    else:
+                        troughs[j] = 1
+            j = nxt
+    return troughs
+
 def trough_standardization(column, dev_min, dev_max):
     
     #************************************************************************************************************
@@ -28,67 +74,82 @@ def trough_standardization(column, dev_min, dev_max):
     #
     #************************************************************************************************************
 
-    volt_column = [] 
-    int_list =[] # sequences of 0s and 1s. 
-    troughs=[]
-    
-    for i in range(0, len(column)): 
-        volt_column.append(round(column[i], 2))
-    
-    channel_mean = (sum(volt_column)/len(volt_column))
-    min_val=round(channel_mean - dev_min, 2) # * 
+    volt_column, channel_mean = _prep(column)
+    return _standardize(volt_column, channel_mean, dev_min, dev_max)
+
+def _prep(column):
+
+    # Rounding and the mean depend only on the voltages, so diagnostics sweeps
+    # compute them once per file and reuse them for every deviation combination.
+    rounded = np.round(np.asarray(column, dtype=np.float32), 2)
+    return rounded, rounded.mean()
+
+def _standardize(volt_column, channel_mean, dev_min, dev_max):
+
+    min_val=round(channel_mean - dev_min, 2) # *
     max_val=round(channel_mean + dev_max, 2) # *
- 
-    for v in range(0, len(volt_column)):  
-        x=(volt_column[v]-min_val)/(max_val-min_val) 
-        if x < -2:  # *
-            int_list.append(1)  
-        else:
-            int_list.append(0)
-
-    for j in range(0, len(int_list)-1): 
-        if int_list[j] > int_list[j-1] and int_list[j] >= int_list[j+1]: 
-            if int_list[j-3] >= int_list[j] or int_list[j-5] >= int_list[j] or int_list[j-7] >= int_list[j]: # double troughs
-                troughs.append(0)
-                for i in range(j, j + 100): # 100 = sample rate - 100 time points/s # peaks can be anywhere from 4-30 points
-                    try:
-                        int_list[i] = 0
-                    except IndexError:
-                        continue 
-            else:
-                troughs.append(1)
-        else:
-            troughs.append(0)
-
-    troughs.append(0)
-
-#    print("   Num of 1's:", sum(int_list), "   Num of troughs:", sum(troughs),
-#          "   Min Dev: ", dev_min, "   Max Dev: ", dev_max)
-    
+
+    x = (volt_column - min_val) / (max_val - min_val)
+    int_list = (x < -2).astype(np.int8) # * sequences of 0s and 1s.
+
+    # a candidate is any rising edge, found with one bitwise op on the 0/1 array; the old
+    # peak test's second clause (int_list[j] >= int_list[j+1]) is implied by int_list[j] == 1.
+    # np.roll wraps the array ends the same way the old loop's negative indices did.
+    rising = int_list & (1 - np.roll(int_list, 1))
+    candidates = np.flatnonzero(rising)
+
+    troughs = _suppress_doubles(int_list, candidates, 100) # 100 = sample rate - 100 time points/s # peaks can be anywhere from 4-30 points
+
+    if _DEBUG:
+        print("   Num of 1's:", int_list.sum(), "   Num of troughs:", troughs.sum(),
+              "   Min Dev: ", dev_min, "   Max Dev: ", dev_max)
+
+
     return troughs 
 
-def write_to_file(path, file_name, lines, time_col, trough_col):
-    
+def write_to_file(path, file_name, time_col, trough_col):
+
     #************************************************************************************************************
     #
     # Write txt file for the standardized troughs.
     #
-    # INPUT:    path as a string, file name as a string, lines as an integer, time column as floats, and
-    #           trough column as floats. 
+    # INPUT:    path as a string, file name as a string, time column as floats, and trough column as floats.
     #
-    # PROCESS:  Output file is opened with its designated outpath. Then, line by line, the time and trough rows
-    #           are written.
+    # PROCESS:  The time and trough columns are stacked and written in a single np.savetxt call, which
+    #           formats the rows in C instead of one Python write per line.
     #
     # OUTPUT:   A txt file with two columns: a time column and a trough column of 0's and 1's.
     #
     #************************************************************************************************************
-    
+
         #outpath = path + "standardized_files/"
-        OutputFile = open(path + "standardized_" + str(file_name), mode="w")
-        for i in range(0, len(lines)):
-            OutputFile.write('%.2f' % time_col[i] + ", " +
-                             '%.2f' % trough_col[i] + "\n")
-        OutputFile.close()
+        np.savetxt(path + "standardized_" + str(file_name),
+                   np.column_stack([np.asarray(time_col), np.asarray(trough_col)]),
+                   fmt='%.2f', delimiter=', ')
+
+def process_one(file, path, out_path):
+
+    #************************************************************************************************************
+    #
+    # Standardizes a single split file: loads it, runs trough_standardization, and writes the result.
+    # Files are independent, so this is the unit of work handed to the process pool below.
+    #
+    #   After running diagnostics, define the trough_column with specific min and max deviation values in the
+    #   trough_standardization function below. The default here is a min deviation and max deviation value of
+    #   0.01 V.
+    #
+    #************************************************************************************************************
+
+    print("\n", file)
+    filepath = path + str(file)
+
+    # C parser reads the file in one call instead of splitting and casting per line
+    data = np.loadtxt(filepath, delimiter=',', usecols=(0, 1), dtype=np.float64, encoding='latin-1')
+    time_column, voltage_column = data[:, 0], data[:, 1]
+
+    trough_column = trough_standardization(voltage_column, 0.1, 0.1)
+
+    write_to_file(out_path, file, time_column, trough_column)
 
 #************************************************************************************************************
 #   To call the recording data file, write the complete file directory path below. An example path is
@@ -99,43 +160,21 @@ def write_to_file(path, file_name, lines, time_col, trough_col):
 #************************************************************************************************************
 
 if __name__=="__main__":
-    
-    #main_path = r"/Users/anastasiabernat/Desktop/git_repositories/undergrad-collabs/max_speed/" # input the path to the Flight_scripts directory here 
-    main_path = r"/Users/anastasiabernat/Desktop/Dispersal/Trials-Winter2020/" 
+
+    #main_path = r"/Users/anastasiabernat/Desktop/git_repositories/undergrad-collabs/max_speed/" # input the path to the Flight_scripts directory here
+    main_path = r"/Users/anastasiabernat/Desktop/Dispersal/Trials-Winter2020/"
     path = main_path + "split_files/"
     dir_list = sorted(os.listdir(path))
 
+    out_path = r"/Users/anastasiabernat/Desktop/Dispersal/Trials-Winter2020/standardize_files/"
+    #out_path = r"/Users/anastasiabernat/Desktop/"
+
     print("Files in '", path, "' :")
 
-    for file in dir_list:
-        
-        print("\n", file)
-        filepath = path + str(file)
-        InputFile = open(filepath, mode="r", encoding='latin-1')
-        Lines = InputFile.readlines()
-        
-        time_column = []
-        voltage_column = []
-
-        for i in range(0, len(Lines)):
-            raw = Lines[i]
-            a,b,c = raw.split(",") 
-            time_column.append(float(a)) 
-            voltage_column.append(float(b)) 
-
-        InputFile.close()
-
-        #************************************************************************************************************
-        #   After running diagnostics, define the trough_column with specific min and max deviation values in the
-        #   trough_standardization function below. The default here is a min deviation and max deviation value of 
-        #   0.01 V.
-        #************************************************************************************************************
-        
-        trough_column = trough_standardization(voltage_column, 0.1, 0.1) 
-
-        out_path = r"/Users/anastasiabernat/Desktop/Dispersal/Trials-Winter2020/standardize_files/"
-        #out_path = r"/Users/anastasiabernat/Desktop/"
-        write_to_file(out_path, file, Lines, time_column, trough_column) 
+    # files are independent, so the pool fans them out across cores
+    worker = partial(process_one, path=path, out_path=out_path)
+    with mp.Pool(mp.cpu_count()) as pool:
+        pool.map(worker, dir_list, chunksize=2)
 
 #**********************************************************************************************
 # This file has been modified from Attisano et al. 2015.